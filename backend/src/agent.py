@@ -4,14 +4,155 @@ Agent module for summarizing GWAS traits and fetching related images.
 from typing import List, Dict, Optional
 import os
 import json
-import requests
+import asyncio
 from bs4 import BeautifulSoup
 from google import genai
 import dotenv
 import logging
+from urllib.parse import quote_plus
+from http_engine import get_engine
+from image_cache import get_image_cache
+from summary_cache import get_summary_cache
 
 dotenv.load_dotenv()
 GEN_MODEL = "gemini-2.0-flash"
+# Traits are summarised in shards of roughly this many prompt tokens, at most
+# SUMMARY_CONCURRENCY shards at a time
+SUMMARY_SHARD_TOKENS = int(os.getenv("SUMMARY_SHARD_TOKENS", "12000"))
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", "4"))
+# Image searches run at the same time per find_images_async call
+IMAGE_CONCURRENCY = int(os.getenv("IMAGE_CONCURRENCY", "8"))
+# Rough token estimate for English text and JSON: about four characters per token
+CHARS_PER_TOKEN = 4
+# Association fields the summary prompt uses, and their names in the compacted prompt data
+COMPACT_FIELDS = {
+    "rsid_from_vep": "rsid",
+    "gene_symbol_from_vep": "gene",
+    "riskAllele_GWAS": "risk_allele",
+    "OR": "or",
+    "beta": "beta",
+    "pValue": "p",
+}
+# Associations are summarised only below this p-value and with an OR at least this far from 1.0
+SUMMARY_MAX_PVALUE = 0.01
+SUMMARY_MIN_OR_DISTANCE = 0.15
+# Bump whenever SUMMARY_PROMPT or the prompt data format changes, so cached summaries from the old prompt are not reused
+SUMMARY_PROMPT_VERSION = 3
+
+SUMMARY_PROMPT = """
+            You are a medical doctor, part of a program that helps patients understand their genetic variants, along with the GWAS traits they are associated with.
+            The GWAS catalog has been searched, and traits that show significance are listed below, along with important details such as the OR value. Each trait should also have an abstract from the study that found the association.
+            The data is JSON: "traits" lists each trait with its studies (by PMID) and their associations, and "abstracts" gives each study's abstract once, keyed by PMID.
+
+            Give an in depth but comprehensive summary of the GWAS traits, and how they are associated with the variant. 
+
+            The important information is:
+            Trait title:
+            Increase/decrease of chance as percentage
+            Details of the GWAS trait
+            Whether having this gene is a good or bad thing
+
+            Give one summary per trait, and copy the trait's "trait" value from the data, unchanged, into its "trait" field.
+
+            Data should be given as JSON:
+            [
+            {{"trait": "Trait from the data", "trait_title": "Trait title", "increase_decrease": "Increase/decrease of chance as percentage", "details": "Details of the GWAS trait", "good_or_bad": "Good or bad"}},
+            {{"trait": "Trait from the data", "trait_title": "Trait title", "increase_decrease": "Increase/decrease of chance as percentage", "details": "Details of the GWAS trait", "good_or_bad": "Good or bad"}},
+            {{"trait": "Trait from the data", "trait_title": "Trait title", "increase_decrease": "Increase/decrease of chance as percentage", "details": "Details of the GWAS trait", "good_or_bad": "Good or bad"}}
+            ]
+
+            {info}
+        """
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def trait_key(title: Optional[str]) -> str:
+    """Normalise a trait title for grouping and deduplication."""
+    return " ".join(str(title or "").split()).casefold()
+
+def summary_trait_key(summary: Dict) -> str:
+    """
+    Key of the input trait a summary belongs to: the trait name the model echoes back,
+    falling back to its (possibly reworded) title.
+    """
+    return trait_key(summary.get('trait') or summary.get('trait_title'))
+
+def group_traits(traits: List[Dict]) -> Dict[str, List[Dict]]:
+    """Group GWAS trait records by normalised trait name, in first-seen order."""
+    groups: Dict[str, List[Dict]] = {}
+    for trait in traits:
+        groups.setdefault(trait_key(trait.get('traitName')), []).append(trait)
+    return groups
+
+def _compact_dumps(value: object) -> str:
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+def study_abstracts(traits: List[Dict]) -> Dict[str, str]:
+    """Return the first non-empty abstract per PMID."""
+    abstracts: Dict[str, str] = {}
+    for trait in traits:
+        if trait.get('abstract'):
+            abstracts.setdefault(str(trait.get('pubmedId')), trait['abstract'])
+    return abstracts
+
+def compact_trait(records: List[Dict]) -> Dict:
+    """
+    Compact one trait's records: associations grouped by study, keeping only COMPACT_FIELDS
+    with known values, without duplicates and without abstracts.
+    """
+    studies: Dict[str, List[Dict]] = {}
+    for record in records:
+        row = {
+            short: record[name] for name, short in COMPACT_FIELDS.items()
+            if record.get(name) not in (None, "", "N/A")
+        }
+        rows = studies.setdefault(str(record.get('pubmedId')), [])
+        if row not in rows:
+            rows.append(row)
+    return {
+        "trait": records[0].get('traitName'),
+        "studies": [{"pmid": pmid, "associations": rows} for pmid, rows in studies.items()],
+    }
+
+def compact_traits(traits: List[Dict]) -> str:
+    """
+    Serialise trait records as the prompt data: traits with their studies and associations,
+    plus each study's abstract once, in JSON without whitespace.
+    """
+    return _compact_dumps({
+        "traits": [compact_trait(records) for records in group_traits(traits).values()],
+        "abstracts": study_abstracts(traits),
+    })
+
+def shard_traits(traits: List[Dict], token_budget: int = SUMMARY_SHARD_TOKENS) -> List[List[Dict]]:
+    """
+    Split GWAS trait records into shards whose compacted prompt data (see compact_traits)
+    stays within token_budget, minus the prompt template. An abstract shared by traits in
+    one shard is counted once. Records for the same trait always share a shard, so each
+    trait is summarised once; a trait larger than the budget gets a shard of its own.
+    """
+    budget = max(token_budget - estimate_tokens(SUMMARY_PROMPT), 1)
+
+    shards: List[List[Dict]] = []
+    current: List[Dict] = []
+    current_pmids: set = set()
+    current_tokens = 0
+    for group in group_traits(traits).values():
+        entry_tokens = estimate_tokens(_compact_dumps(compact_trait(group)))
+        abstracts = study_abstracts(group)
+        tokens = entry_tokens + sum(estimate_tokens(text) for pmid, text in abstracts.items() if pmid not in current_pmids)
+        if current and current_tokens + tokens > budget:
+            shards.append(current)
+            current, current_pmids = [], set()
+            current_tokens = 0
+            tokens = entry_tokens + sum(estimate_tokens(text) for text in abstracts.values())
+        current.extend(group)
+        current_pmids.update(abstracts)
+        current_tokens += tokens
+    if current:
+        shards.append(current)
+    return shards
 
 class Agent:
     """
@@ -35,80 +176,190 @@ class Agent:
         Returns:
             List[Dict]: List of trait summaries.
         """
+        return get_engine().run(self.summarise_traits_no_images_async(info))
 
-        print("hrererer")
-        prompt = f"""
-            You are a medical doctor, part of a program that helps patients understand their genetic variants, along with the GWAS traits they are associated with.
-            The GWAS catalog has been searched, and traits that show significance are listed below, along with important details such as the OR value. Each trait should also have an abstract from the study that found the association.
-
-            Give an in depth but comprehensive summary of the GWAS traits, and how they are associated with the variant. 
-
-            The important information is:
-            Trait title:
-            Increase/decrease of chance as percentage
-            Details of the GWAS trait
-            Whether having this gene is a good or bad thing
-
-            Data should be given as JSON:
-            [
-            {{"trait_title": "Trait title", "increase_decrease": "Increase/decrease of chance as percentage", "details": "Details of the GWAS trait", "good_or_bad": "Good or bad"}},
-            {{"trait_title": "Trait title", "increase_decrease": "Increase/decrease of chance as percentage", "details": "Details of the GWAS trait", "good_or_bad": "Good or bad"}},
-            {{"trait_title": "Trait title", "increase_decrease": "Increase/decrease of chance as percentage", "details": "Details of the GWAS trait", "good_or_bad": "Good or bad"}}
-            ]
-
-            {info}
+    async def summarise_traits_no_images_async(self, info: str, shard_index: int = 0) -> List[Dict]:
+        """
+        Summarize one shard of GWAS traits with a single LLM request.
+        Args:
+            info (str): GWAS information string.
+            shard_index (int): Shard number, for logging.
+        Returns:
+            List[Dict]: Trait summaries, or [] if the request or its JSON failed.
         """
+        prompt = SUMMARY_PROMPT.format(info=info)
         try:
-            # print("prompt", prompt)
-            response = self.client.models.generate_content(
+            response = await self.client.aio.models.generate_content(
                 model=GEN_MODEL,
                 contents=prompt,
             )
-            # print("response", response)
             # Clean up LLM response
             clean_text = response.text.replace("```json", "").replace("```", "")
-            return json.loads(clean_text)
+            summaries = json.loads(clean_text)
+            if not isinstance(summaries, list):
+                raise ValueError(f"expected a JSON list, got {type(summaries).__name__}")
+            return [summary for summary in summaries if isinstance(summary, dict)]
         except Exception as e:
-            logging.error(f"Error in summarise_traits_no_images: {e}")
+            logging.error(f"Error in summarise_traits_no_images (shard {shard_index}): {e}")
             return []
 
-    def find_image(self, trait_title: str) -> Optional[str]:
+    async def summarise_shards_async(self, shards: List[List[Dict]]) -> List[Dict]:
+        """
+        Summarise shards concurrently, at most SUMMARY_CONCURRENCY at a time, and merge the
+        results in shard order, keeping the first summary of each trait title.
+        A failed shard only loses its own traits.
         """
-        Fetch a representative image URL for a given trait title using Bing Images.
+        semaphore = asyncio.Semaphore(SUMMARY_CONCURRENCY)
+        infos = [compact_traits(shard) for shard in shards]
+        uncompacted = sum(len(json.dumps(shard, indent=2)) for shard in shards)
+        compacted = sum(len(info) for info in infos)
+        logging.info(
+            f"Prompt data compacted from {uncompacted} to {compacted} characters "
+            f"(~{uncompacted // CHARS_PER_TOKEN} -> ~{compacted // CHARS_PER_TOKEN} tokens) across {len(shards)} shards"
+        )
+
+        async def summarise(shard_index: int, info: str) -> List[Dict]:
+            async with semaphore:
+                return await self.summarise_traits_no_images_async(info, shard_index)
+
+        shard_results = await asyncio.gather(*(summarise(i, info) for i, info in enumerate(infos)))
+        failed = sum(1 for shard, result in zip(shards, shard_results) if shard and not result)
+        if failed:
+            logging.warning(f"{failed} of {len(shards)} summary shards returned no summaries")
+
+        merged: List[Dict] = []
+        seen = set()
+        for result in shard_results:
+            for summary in result:
+                key = summary_trait_key(summary)
+                if key in seen:
+                    continue
+                seen.add(key)
+                merged.append(summary)
+        return merged
+
+    def summarise_with_cache(self, traits: List[Dict]) -> List[Dict]:
+        """
+        Summarise trait records, sending only traits without a cached summary to the model.
+        Fresh summaries are matched to their input trait by the trait name the prompt asks the
+        model to echo back, and cached under the hash of that trait's associations (see
+        summary_cache.py); summaries that match no input trait are returned but not cached.
+        Args:
+            traits (List[Dict]): Filtered GWAS trait records.
+        Returns:
+            List[Dict]: Trait summaries in input order.
+        """
+        summary_cache = get_summary_cache()
+        groups = group_traits(traits)
+        cached = summary_cache.get_many(groups)
+        uncached = [record for name, records in groups.items() if name not in cached for record in records]
+        logging.info(f"Summary cache: {len(cached)} of {len(groups)} traits cached")
+
+        fresh: List[Dict] = []
+        if uncached:
+            # Summarise token-budgeted shards of the remaining traits concurrently
+            shards = shard_traits(uncached)
+            logging.info(f"Summarising {len(groups) - len(cached)} traits in {len(shards)} shards")
+            fresh = get_engine().run(self.summarise_shards_async(shards))
+            summary_cache.put_many({
+                summary_trait_key(summary): summary for summary in fresh
+            }, {name: records for name, records in groups.items() if name not in cached})
+
+        fresh_by_trait = {summary_trait_key(summary): summary for summary in fresh}
+        summaries: List[Dict] = []
+        for name in groups:
+            if name in cached:
+                summaries.append(cached[name])
+            elif name in fresh_by_trait:
+                summaries.append(fresh_by_trait.pop(name))
+        # Fresh summaries that did not match an input trait
+        summaries.extend(fresh_by_trait.values())
+        return summaries
+
+    async def find_image_async(self, trait_title: str) -> Optional[str]:
+        """
+        Return a representative image URL for a trait title, from the image cache or a
+        Bing Images search through the shared HTTP engine. Searches that find no image are
+        cached as misses; failed requests are not cached.
         Args:
             trait_title (str): Trait name.
         Returns:
             Optional[str]: Image URL or None if not found.
         """
+        image_cache = get_image_cache()
+        cached = await asyncio.to_thread(image_cache.get_many, [trait_title])
+        if trait_title in cached:
+            return cached[trait_title]
         try:
             url = (
-                f"https://www.bing.com/images/search?q={trait_title}" 
+                f"https://www.bing.com/images/search?q={quote_plus(trait_title)}"
                 "+qft=+filterui:aspect-square+filterui:photo-clipart&form=IRFLTR&first=1"
             )
-            response = requests.get(url, timeout=5)
-            soup = BeautifulSoup(response.text, 'html.parser')
-            images = soup.find_all('img', {'class': 'mimg'})
-            for image_tag in images:
-                src = image_tag.get('src', '')
-                if src.startswith("http"):
-                    return src
+            response = await get_engine().request("GET", url, timeout=5, max_attempts=1)
+            response.raise_for_status()
+            image_url = await asyncio.to_thread(self._first_image_url, response.text)
         except Exception as e:
             logging.warning(f"Image fetch failed for '{trait_title}': {e}")
+            return None
+        await asyncio.to_thread(image_cache.put, trait_title, image_url)
+        return image_url
+
+    @staticmethod
+    def _first_image_url(html: str) -> Optional[str]:
+        soup = BeautifulSoup(html, 'html.parser')
+        images = soup.find_all('img', {'class': 'mimg'})
+        for image_tag in images:
+            src = image_tag.get('src', '')
+            if src.startswith("http"):
+                return src
         return None
 
-    def summarise_traits(self, traits: str | List[Dict]) -> List[Dict]:
+    def find_image(self, trait_title: str) -> Optional[str]:
+        """
+        Blocking wrapper around find_image_async.
+        Args:
+            trait_title (str): Trait name.
+        Returns:
+            Optional[str]: Image URL or None if not found.
+        """
+        return get_engine().run(self.find_image_async(trait_title))
+
+    async def find_images_async(self, trait_titles: List[str]) -> Dict[str, Optional[str]]:
+        """
+        Resolve images for several trait titles concurrently, at most IMAGE_CONCURRENCY
+        searches at a time; each distinct title is looked up once.
+        Returns:
+            Dict[str, Optional[str]]: Image URL (or None) per title.
+        """
+        semaphore = asyncio.Semaphore(IMAGE_CONCURRENCY)
+        titles = list(dict.fromkeys(trait_titles))
+
+        async def find(title: str) -> Optional[str]:
+            async with semaphore:
+                return await self.find_image_async(title)
+
+        urls = await asyncio.gather(*(find(title) for title in titles))
+        return dict(zip(titles, urls))
+
+    @staticmethod
+    def cached_images(trait_titles: List[str]) -> Dict[str, Optional[str]]:
+        """Return the images already cached for trait titles, without searching."""
+        return get_image_cache().get_many(trait_titles)
+
+    def summarise_traits(self, traits: str | List[Dict], resolve_images: bool = True) -> List[Dict]:
         """
         Summarize traits and fetch images for each trait.
         Args:
             traits (str | List[Dict]): GWAS traits info as either a JSON string or a list of dicts.
+            resolve_images (bool): Search for uncached images before returning. When False,
+                only cached images are filled in and the rest are left as None, to be
+                resolved later with find_images_async.
         Returns:
             List[Dict]: List of trait summaries with images.
         """
         if isinstance(traits, str):
             traits = traits.replace("```json", "").replace("```", "")
             traits = json.loads(traits)
-        print("before", len(traits))
-        
         def parse_number(s):
             """Helper to safely parse numbers that might be in scientific notation"""
             try:
@@ -127,7 +378,7 @@ class Agent:
                 
             # Parse p-value (handle scientific notation)
             pval = parse_number(trait['pValue'])
-            if pval is None or pval >= 0.01:  # Skip if p-value is missing or >= 0.01
+            if pval is None or pval >= SUMMARY_MAX_PVALUE:  # Skip if p-value is missing or not significant
                 continue
                 
             # Handle OR value
@@ -137,24 +388,27 @@ class Agent:
                 
             try:
                 or_float = float(or_val)
-                if abs(or_float - 1) < 0.15:  # Skip if OR is too close to 1.0
+                if abs(or_float - 1) < SUMMARY_MIN_OR_DISTANCE:  # Skip if OR is too close to 1.0
                     continue
             except (ValueError, TypeError):
                 continue
                 
             # If we get here, keep the trait
             filtered_traits.append(trait)
-        print("after", len(filtered_traits))
         traits = filtered_traits
-        print(filtered_traits[:10])
         
-        # Convert traits to a string representation for the LLM
-        traits_str = json.dumps(traits, indent=2)
-        llm_info = self.summarise_traits_no_images(traits_str)
+        llm_info = self.summarise_with_cache(traits)
         
+        titles = [trait.get('trait_title') or '' for trait in llm_info]
+        if resolve_images:
+            # Look up all images concurrently on the shared HTTP engine
+            images = get_engine().run(self.find_images_async(titles))
+        else:
+            images = self.cached_images(titles)
+
         trait_info_with_images = []
-        for trait in llm_info:
-            image_url = self.find_image(trait.get('trait_title', ''))
+        for trait, title in zip(llm_info, titles):
+            image_url = images.get(title)
             trait_info_with_images.append({
                 'trait_title': trait.get('trait_title'),
                 'increase_decrease': trait.get('increase_decrease', 'N/A'),
@@ -0,0 +1,179 @@
+"""
+Cache module providing persistent, process-shared key/value stores backed by SQLite.
+"""
+import os
+import json
+import sqlite3
+import threading
+import time
+import zlib
+import logging
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+CACHE_DIR = os.getenv("VARIANTEXPLAIN_CACHE_DIR", "cache")
+# SQLite limits the number of bound parameters per statement; stay well below it.
+MAX_KEYS_PER_QUERY = 500
+
+class KVCache:
+    """
+    Persistent key/value store in a single SQLite table.
+    Values are JSON-encoded and zlib-compressed. The database runs in WAL mode so
+    several processes can share one file, and a lock makes one instance thread-safe.
+    Entries older than ttl seconds are treated as missing. With max_bytes, reads record
+    an access time and writes evict least recently used entries until the stored
+    (compressed) values fit.
+    """
+    def __init__(self, name: str, path: Optional[str] = None, ttl: Optional[float] = None,
+                 max_bytes: Optional[int] = None) -> None:
+        """
+        Open (or create) the cache.
+        Args:
+            name (str): Table name, also used for the default file name.
+            path (Optional[str]): SQLite file path. Defaults to CACHE_DIR/<name>.sqlite.
+            ttl (Optional[float]): Entry lifetime in seconds. None keeps entries forever.
+            max_bytes (Optional[int]): Size bound for LRU eviction. None never evicts.
+        """
+        self.name = name
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.path = path or os.path.join(CACHE_DIR, f"{name}.sqlite")
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.name} ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, created REAL NOT NULL, accessed REAL)"
+        )
+        columns = {row[1] for row in self._conn.execute(f"PRAGMA table_info({self.name})")}
+        if "accessed" not in columns:
+            # Tables created before LRU support
+            self._conn.execute(f"ALTER TABLE {self.name} ADD COLUMN accessed REAL")
+        self._conn.commit()
+
+    @staticmethod
+    def _encode(value: Any) -> bytes:
+        return zlib.compress(json.dumps(value, separators=(",", ":")).encode("utf-8"))
+
+    @staticmethod
+    def _decode(blob: bytes) -> Any:
+        return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """
+        Look up several keys at once.
+        Args:
+            keys (Iterable[str]): Keys to look up.
+        Returns:
+            Dict[str, Any]: Decoded values for the keys that were found.
+        """
+        keys = list(dict.fromkeys(keys))
+        found: Dict[str, Any] = {}
+        min_created = time.time() - self.ttl if self.ttl is not None else 0
+        with self._lock:
+            for i in range(0, len(keys), MAX_KEYS_PER_QUERY):
+                chunk = keys[i : i + MAX_KEYS_PER_QUERY]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM {self.name} WHERE key IN ({placeholders}) AND created >= ?",
+                    [*chunk, min_created],
+                ).fetchall()
+                for key, blob in rows:
+                    try:
+                        found[key] = self._decode(blob)
+                    except (zlib.error, ValueError) as e:
+                        logging.warning(f"Dropping corrupt {self.name} cache entry {key}: {e}")
+            if self.max_bytes is not None and found:
+                now = time.time()
+                self._conn.executemany(
+                    f"UPDATE {self.name} SET accessed = ? WHERE key = ?", [(now, key) for key in found]
+                )
+                self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Look up a single key, returning default when it is missing or expired."""
+        return self.get_many([key]).get(key, default)
+
+    def put_many(self, items: Dict[str, Any]) -> None:
+        """
+        Store several values at once, replacing existing entries.
+        Args:
+            items (Dict[str, Any]): Mapping of key to JSON-serialisable value.
+        """
+        if not items:
+            return
+        now = time.time()
+        rows = [(key, self._encode(value), now, now) for key, value in items.items()]
+        with self._lock:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO {self.name} (key, value, created, accessed) VALUES (?, ?, ?, ?)", rows
+            )
+            if self.max_bytes is not None:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        """Delete least recently used entries until the stored values fit in max_bytes."""
+        total = self._conn.execute(f"SELECT COALESCE(SUM(LENGTH(value)), 0) FROM {self.name}").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = []
+        for key, size in self._conn.execute(
+            f"SELECT key, LENGTH(value) FROM {self.name} ORDER BY COALESCE(accessed, created)"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+        self._conn.executemany(f"DELETE FROM {self.name} WHERE key = ?", evicted)
+        logging.info(f"Evicted {len(evicted)} least recently used {self.name} cache entries")
+
+    def put(self, key: str, value: Any) -> None:
+        """Store a single value."""
+        self.put_many({key: value})
+
+    def delete_prefix(self, prefix: str) -> int:
+        """
+        Delete every entry whose key starts with prefix ("" clears the cache).
+        Returns:
+            int: Number of entries deleted.
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                f"DELETE FROM {self.name} WHERE substr(key, 1, ?) = ?", (len(prefix), prefix)
+            )
+            self._conn.commit()
+            return cursor.rowcount
+
+    def items(self, batch_size: int = MAX_KEYS_PER_QUERY) -> Iterator[Tuple[str, Any]]:
+        """
+        Iterate over every unexpired entry in key order, reading batch_size rows at a time
+        so the whole table is never held in memory. Reads do not count as accesses.
+        """
+        min_created = time.time() - self.ttl if self.ttl is not None else 0
+        last_key = ""
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM {self.name} WHERE key > ? AND created >= ? ORDER BY key LIMIT ?",
+                    (last_key, min_created, batch_size),
+                ).fetchall()
+            if not rows:
+                return
+            for key, blob in rows:
+                try:
+                    yield key, self._decode(blob)
+                except (zlib.error, ValueError) as e:
+                    logging.warning(f"Skipping corrupt {self.name} cache entry {key}: {e}")
+            last_key = rows[-1][0]
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit and miss counts for this instance."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
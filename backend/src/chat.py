@@ -0,0 +1,179 @@
+"""
+Chat module for answering follow-up questions about a finished analysis: each question
+retrieves the few most relevant abstracts of that analysis from the vector index and
+streams the model's answer back token by token.
+"""
+import os
+import re
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from google import genai
+from rag import get_abstract_store
+from vector_index import get_vector_index
+
+# Abstracts retrieved per question
+CHAT_TOP_K = int(os.getenv("CHAT_TOP_K", "5"))
+# Characters of each retrieved abstract included in the prompt
+CHAT_ABSTRACT_CHARS = int(os.getenv("CHAT_ABSTRACT_CHARS", "1500"))
+# Associations of the retrieved abstracts included in the prompt
+CHAT_MAX_ASSOCIATIONS = 20
+# Previous question/answer pairs included in the prompt
+CHAT_HISTORY_TURNS = 3
+
+CHAT_PROMPT = """
+You are a medical doctor, part of a program that helps patients understand their genetic variants, along with the GWAS traits they are associated with.
+Answer the patient's question using only the GWAS associations and study abstracts below. If they do not answer it, say so.
+Be concise and explain any medical terms.
+
+Traits found in this analysis: {traits}
+
+Relevant associations:
+{associations}
+
+Relevant abstracts:
+{abstracts}
+{history}
+Question: {question}
+"""
+
+def load_abstracts(pmids: List[str]) -> Dict[str, str]:
+    """Return the stored abstracts for PMIDs (the store RAG fills while fetching them)."""
+    return get_abstract_store().get_many(pmids)
+
+def association_pmids(associations: List[Dict[str, Any]]) -> List[str]:
+    return list(dict.fromkeys(str(a.get("pubmedId")) for a in associations if a.get("pubmedId") not in (None, "N/A")))
+
+async def index_abstracts_async(associations: List[Dict[str, Any]]) -> int:
+    """
+    Embed the abstracts of an analysis' associations that are not in the vector index yet.
+    Failures are logged, not raised: chat then falls back to keyword retrieval.
+    """
+    try:
+        abstracts = await asyncio.to_thread(load_abstracts, association_pmids(associations))
+        return await asyncio.to_thread(get_vector_index().index_abstracts, abstracts)
+    except Exception as e:
+        logging.warning(f"Indexing abstracts for chat failed: {e}")
+        return 0
+
+def _words(text: str) -> set:
+    return {word for word in re.findall(r"[a-z0-9]+", text.lower()) if len(word) > 2}
+
+class ChatSession:
+    """
+    Conversation about one finished analysis. Each question is answered from a prompt
+    bounded by CHAT_TOP_K abstracts and their associations rather than the full results.
+    """
+    def __init__(self, trait_titles: List[str], associations: List[Dict[str, Any]]) -> None:
+        """
+        Args:
+            trait_titles (List[str]): Titles of the analysis' trait summaries.
+            associations (List[Dict]): The analysis' GWAS associations (without abstracts).
+        """
+        from agent import GEN_MODEL
+        from embeddings import Embedder
+        api_key = os.getenv("GOOGLE_API_KEY")
+        if not api_key:
+            raise ValueError("GOOGLE_API_KEY not set in environment.")
+        self.model = GEN_MODEL
+        self.client = genai.Client(api_key=api_key)
+        self.embedder = Embedder()
+        self.trait_titles = trait_titles
+        self.associations = associations
+        self.pmids = association_pmids(associations)
+        self.abstracts: Dict[str, str] = {}
+        self.history: List[Tuple[str, str]] = []
+        self._indexing: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        """
+        Load the analysis' abstracts and index any new ones in the background, so the first
+        question does not wait for embedding requests.
+        """
+        self.abstracts = await asyncio.to_thread(load_abstracts, self.pmids)
+        self._indexing = asyncio.create_task(self._index_abstracts())
+
+    async def _index_abstracts(self) -> None:
+        try:
+            await asyncio.to_thread(get_vector_index().index_abstracts, self.abstracts, self.embedder)
+        except Exception as e:
+            logging.warning(f"Indexing abstracts for chat failed: {e}")
+
+    @property
+    def indexed(self) -> bool:
+        """Whether background indexing of the analysis' abstracts has finished."""
+        return self._indexing is not None and self._indexing.done()
+
+    async def retrieve(self, question: str) -> List[str]:
+        """
+        Return the PMIDs of the analysis' abstracts most relevant to the question, by
+        embedding similarity; uses keyword overlap until indexing has finished, or if the
+        embedding request fails.
+        """
+        if not self.indexed:
+            return self._keyword_retrieve(question)
+        try:
+            query = (await self.embedder.embed_batch_async([question], task_type="RETRIEVAL_QUERY"))[0]
+            hits = await asyncio.to_thread(get_vector_index().search, query, CHAT_TOP_K, list(self.abstracts))
+            if hits:
+                return [pmid for pmid, _ in hits]
+        except Exception as e:
+            logging.warning(f"Vector retrieval failed, using keyword overlap: {e}")
+        return self._keyword_retrieve(question)
+
+    def _keyword_retrieve(self, question: str) -> List[str]:
+        question_words = _words(question)
+        traits: Dict[str, str] = {}
+        for association in self.associations:
+            pmid = str(association.get("pubmedId"))
+            traits[pmid] = traits.get(pmid, "") + " " + str(association.get("traitName", ""))
+        scores = {
+            pmid: len(question_words & _words(traits.get(pmid, "") + " " + self.abstracts.get(pmid, "")))
+            for pmid in self.pmids
+        }
+        ranked = sorted(self.pmids, key=lambda pmid: -scores[pmid])
+        return [pmid for pmid in ranked if scores[pmid]][:CHAT_TOP_K]
+
+    def build_prompt(self, question: str, pmids: List[str]) -> str:
+        """Fill CHAT_PROMPT with the retrieved abstracts, their associations and recent turns."""
+        selected = set(pmids)
+        associations = [a for a in self.associations if str(a.get("pubmedId")) in selected][:CHAT_MAX_ASSOCIATIONS]
+        association_lines = "\n".join(
+            f"- {a.get('traitName')}: {a.get('rsid_from_vep')} ({a.get('gene_symbol_from_vep')}), "
+            f"risk allele {a.get('riskAllele_GWAS')}, OR {a.get('OR')}, beta {a.get('beta')}, "
+            f"p-value {a.get('pValue')}, PMID {a.get('pubmedId')}"
+            for a in associations
+        ) or "None"
+        abstract_lines = "\n\n".join(
+            f"PMID {pmid}: {self.abstracts[pmid][:CHAT_ABSTRACT_CHARS]}" for pmid in pmids if pmid in self.abstracts
+        ) or "None"
+        history = "".join(
+            f"\nPatient: {asked}\nDoctor: {answered}\n" for asked, answered in self.history[-CHAT_HISTORY_TURNS:]
+        )
+        return CHAT_PROMPT.format(
+            traits=", ".join(self.trait_titles) or "None",
+            associations=association_lines,
+            abstracts=abstract_lines,
+            history=history,
+            question=question,
+        )
+
+    async def ask(self, question: str, pmids: Optional[List[str]] = None) -> AsyncIterator[str]:
+        """
+        Stream the answer to a question as the model generates it, and record the turn.
+        Args:
+            question (str): The patient's question.
+            pmids (Optional[List[str]]): Retrieved PMIDs; retrieved here when not given.
+        Returns:
+            AsyncIterator[str]: Answer text chunks.
+        """
+        if pmids is None:
+            pmids = await self.retrieve(question)
+        prompt = self.build_prompt(question, pmids)
+        answer: List[str] = []
+        stream = await self.client.aio.models.generate_content_stream(model=self.model, contents=prompt)
+        async for chunk in stream:
+            if chunk.text:
+                answer.append(chunk.text)
+                yield chunk.text
+        self.history.append((question, "".join(answer)))
@@ -0,0 +1,181 @@
+"""
+CSQ module for annotating VCFs offline from existing VEP (CSQ) or snpEff (ANN) INFO fields.
+"""
+import os
+import re
+import logging
+from operator import itemgetter
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+from vcf_reader import VCFReader
+
+# "auto" annotates locally whenever a CSQ/ANN header is present; "vep" always uses the REST API
+ANNOTATION_MODE = os.getenv("ANNOTATION_MODE", "auto")
+# Checked in this order when a file carries both
+CONSEQUENCE_FIELDS = ("CSQ", "ANN")
+LOCAL_BATCH_SIZE = 1000
+
+# Sub-field names for each output key, per INFO field
+_CSQ_COLUMNS = {
+    "variant_allele": ("Allele",),
+    "impact": ("IMPACT",),
+    "gene_symbol": ("SYMBOL",),
+    "sift_prediction": ("SIFT",),
+    "polyphen_prediction": ("PolyPhen",),
+    "existing_variation": ("Existing_variation",),
+}
+_ANN_COLUMNS = {
+    "variant_allele": ("Allele",),
+    "impact": ("Annotation_Impact",),
+    "gene_symbol": ("Gene_Name",),
+}
+# snpEff files annotated with dbNSFP carry per-variant predictions as separate INFO keys
+_DBNSFP_SIFT = {"D": "deleterious", "T": "tolerated"}
+_DBNSFP_POLYPHEN = {"D": "probably_damaging", "P": "possibly_damaging", "B": "benign"}
+
+_HEADER_RE = re.compile(r'^##INFO=<ID=(CSQ|ANN),.*Description="(.*)">\s*$')
+_SCORE_SUFFIX_RE = re.compile(r"\(.*\)$")
+
+def detect_consequence_field(vcf_path: str) -> Optional[Tuple[str, List[str]]]:
+    """
+    Look for a CSQ or ANN INFO header, reading only the header lines.
+    Args:
+        vcf_path (str): Plain or gzip-compressed VCF.
+    Returns:
+        Optional[Tuple[str, List[str]]]: The INFO key and its '|'-separated sub-field names,
+        or None if the file carries neither (or ANNOTATION_MODE is "vep").
+    """
+    if ANNOTATION_MODE == "vep" or not vcf_path.endswith((".vcf", ".vcf.gz")):
+        return None
+    found: Dict[str, List[str]] = {}
+    with VCFReader(vcf_path) as f:
+        for line in f:
+            if not line.startswith("##"):
+                break
+            match = _HEADER_RE.match(line)
+            if not match:
+                continue
+            key, description = match.groups()
+            # VEP: "... Format: Allele|Consequence|..."; snpEff: "...: 'Allele | Annotation | ...' "
+            fields_text = description.split("Format:", 1)[1] if "Format:" in description else description.split(":", 1)[-1]
+            found[key] = [name.strip(" '\"") for name in fields_text.split("|")]
+    for key in CONSEQUENCE_FIELDS:
+        columns = _CSQ_COLUMNS if key == "CSQ" else _ANN_COLUMNS
+        required = columns["variant_allele"] + columns["impact"]
+        if key in found and all(name in found[key] for name in required):
+            return key, found[key]
+    return None
+
+class ConsequenceParser:
+    """
+    Parses CSQ/ANN records into the projected VEP structure consumed by
+    RAG.find_damaging_variants_info. Column positions are resolved once from the header
+    and pulled out of each record with a single itemgetter, so lines without the INFO key
+    cost one regex search and annotated lines one split per record.
+    """
+    def __init__(self, key: str, field_names: List[str]) -> None:
+        self.key = key
+        # The whole INFO key must match, so e.g. bcftools' BCSQ= is not taken for CSQ=
+        self._info_re = re.compile(rf"(?:^|;){re.escape(key)}=([^;]*)")
+        columns = _CSQ_COLUMNS if key == "CSQ" else _ANN_COLUMNS
+        self._outputs: List[str] = []
+        indices: List[int] = []
+        for output, candidates in columns.items():
+            for name in candidates:
+                if name in field_names:
+                    self._outputs.append(output)
+                    indices.append(field_names.index(name))
+                    break
+        if "variant_allele" not in self._outputs or "impact" not in self._outputs:
+            raise ValueError(f"{key} header lacks the Allele/IMPACT sub-fields needed for offline annotation")
+        self._width = max(indices) + 1
+        getter = itemgetter(*indices)
+        self._get = getter if len(indices) > 1 else (lambda parts: (getter(parts),))
+
+    def parse_line(self, line: str) -> Optional[Dict[str, Any]]:
+        """Parse one VCF data line; returns None for headers and malformed lines."""
+        if line.startswith("#"):
+            return None
+        parts = line.rstrip("\n").split("\t")
+        if len(parts) < 8:
+            return None
+        chrom, pos, _id, ref, alt, info = parts[0], parts[1], parts[2] or ".", parts[3], parts[4], parts[7]
+        annotation: Dict[str, Any] = {"input": f"{chrom} {pos} {_id} {ref} {alt}"}
+
+        consequences: List[Dict[str, Any]] = []
+        rsid = _id if _id.startswith("rs") else None
+        match = self._info_re.search(info)
+        if match:
+            value = match.group(1)
+            dbnsfp = self._dbnsfp_predictions(info) if self.key == "ANN" else {}
+            for record in value.split(","):
+                subfields = record.split("|")
+                if len(subfields) < self._width:
+                    continue
+                tc = {name: val for name, val in zip(self._outputs, self._get(subfields)) if val}
+                existing = tc.pop("existing_variation", None)
+                if rsid is None and existing:
+                    rsid = next((v for v in existing.split("&") if v.startswith("rs")), None)
+                for score_key in ("sift_prediction", "polyphen_prediction"):
+                    if score_key in tc:
+                        tc[score_key] = _SCORE_SUFFIX_RE.sub("", tc[score_key])
+                for score_key, prediction in dbnsfp.items():
+                    tc.setdefault(score_key, prediction)
+                consequences.append(tc)
+
+        if rsid:
+            annotation["id"] = rsid
+        annotation["transcript_consequences"] = consequences
+        return annotation
+
+    @staticmethod
+    def _dbnsfp_predictions(info: str) -> Dict[str, str]:
+        predictions: Dict[str, str] = {}
+        for entry in info.split(";"):
+            if entry.startswith("dbNSFP_SIFT_pred="):
+                codes = entry.split("=", 1)[1].split(",")
+                if "D" in codes:
+                    predictions["sift_prediction"] = _DBNSFP_SIFT["D"]
+            elif entry.startswith("dbNSFP_Polyphen2_HDIV_pred="):
+                codes = entry.split("=", 1)[1].split(",")
+                for code in ("D", "P"):
+                    if code in codes:
+                        predictions["polyphen_prediction"] = _DBNSFP_POLYPHEN[code]
+                        break
+        return predictions
+
+def iter_local_annotation_batches(vcf: Union[str, VCFReader], key: str, field_names: List[str], batch_size: int = LOCAL_BATCH_SIZE) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Lazily yield batches of locally parsed annotations from a CSQ/ANN-annotated VCF, given
+    its path or an open VCFReader (whose bytes_read then tracks how far parsing has got).
+    """
+    parser = ConsequenceParser(key, field_names)
+    batch: List[Dict[str, Any]] = []
+    reader = vcf if isinstance(vcf, VCFReader) else VCFReader(vcf)
+    with reader:
+        for line in reader:
+            annotation = parser.parse_line(line)
+            if annotation is None:
+                continue
+            batch.append(annotation)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+def annotate_locally(vcf_path: str) -> Optional[List[Dict[str, Any]]]:
+    """
+    Annotate a VCF from its own CSQ/ANN field without any network access.
+    Returns:
+        Optional[List[Dict[str, Any]]]: Projected annotations, or None if the file has no
+        usable consequence field and must go through the VEP REST API.
+    """
+    detected = detect_consequence_field(vcf_path)
+    if detected is None:
+        return None
+    key, field_names = detected
+    logging.info(f"Annotating {vcf_path} offline from its {key} INFO field")
+    annotations: List[Dict[str, Any]] = []
+    for batch in iter_local_annotation_batches(vcf_path, key, field_names):
+        annotations.extend(batch)
+    return annotations
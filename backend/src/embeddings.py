@@ -3,29 +3,65 @@ Embeddings module for generating text embeddings using Google Generative AI.
 """
 import os
 import logging
-from typing import Optional
+from typing import List, Optional
+import numpy as np
 from google import genai
+from google.genai import types
 import dotenv
 
 dotenv.load_dotenv()
 
-EMBEDDING_MODEL = "gemini-pro"  # Update to your preferred embedding model
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-004")
+# Texts per embed_content request (the API accepts at most 100)
+EMBED_BATCH_SIZE = 100
 
 class Embedder:
     """
     Utility class for generating text embeddings using Google Generative AI.
+    Documents and queries are embedded with their own task types, as retrieval expects.
     """
-    def __init__(self) -> None:
+    def __init__(self, model: str = EMBEDDING_MODEL) -> None:
         api_key = os.getenv("GOOGLE_API_KEY")
         if not api_key:
             raise ValueError("GOOGLE_API_KEY not set in environment.")
+        self.model = model
         try:
-            genai.configure(api_key=api_key)
-            self.model = genai.GenerativeModel(EMBEDDING_MODEL)
+            self.client = genai.Client(api_key=api_key)
         except Exception as e:
             logging.error(f"Failed to initialize embedding model: {e}")
             raise
 
+    def embed_batch(self, texts: List[str], task_type: str = "RETRIEVAL_DOCUMENT") -> np.ndarray:
+        """
+        Embed texts with one request per EMBED_BATCH_SIZE texts.
+        Args:
+            texts (List[str]): Texts to embed.
+            task_type (str): RETRIEVAL_DOCUMENT for indexed texts, RETRIEVAL_QUERY for queries.
+        Returns:
+            np.ndarray: float32 matrix with one row per text.
+        Raises:
+            Exception: If a request fails; no partial result is returned.
+        """
+        config = types.EmbedContentConfig(task_type=task_type)
+        rows: List[List[float]] = []
+        for start in range(0, len(texts), EMBED_BATCH_SIZE):
+            response = self.client.models.embed_content(
+                model=self.model, contents=texts[start:start + EMBED_BATCH_SIZE], config=config,
+            )
+            rows.extend(embedding.values for embedding in response.embeddings)
+        return np.asarray(rows, dtype=np.float32)
+
+    async def embed_batch_async(self, texts: List[str], task_type: str = "RETRIEVAL_DOCUMENT") -> np.ndarray:
+        """Async variant of embed_batch, for use on the shared HTTP engine's loop."""
+        config = types.EmbedContentConfig(task_type=task_type)
+        rows: List[List[float]] = []
+        for start in range(0, len(texts), EMBED_BATCH_SIZE):
+            response = await self.client.aio.models.embed_content(
+                model=self.model, contents=texts[start:start + EMBED_BATCH_SIZE], config=config,
+            )
+            rows.extend(embedding.values for embedding in response.embeddings)
+        return np.asarray(rows, dtype=np.float32)
+
     def embed(self, text: str) -> Optional[list]:
         """
         Generate an embedding for the given text.
@@ -35,13 +71,7 @@ class Embedder:
             Optional[list]: The embedding vector, or None on failure.
         """
         try:
-            response = self.model.generate_content(
-                text,
-                generation_config=genai.GenerativeModel.GenerativeConfig(
-                    embedding=True
-                )
-            )
-            return getattr(response, 'embedding', None)
+            return self.embed_batch([text])[0].tolist()
         except Exception as e:
             logging.error(f"Embedding generation failed: {e}")
             return None
@@ -51,4 +81,4 @@ if __name__ == "__main__":
     embedder = Embedder()
     example_text = "Explain how AI works in a few words."
     embedding = embedder.embed(example_text)
-    print(embedding)
\ No newline at end of file
+    print(embedding)
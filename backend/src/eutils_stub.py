@@ -0,0 +1,76 @@
+"""
+Local stand-in for the NCBI E-utilities efetch endpoint, for testing PubMed retrieval offline.
+
+Usage:
+    poetry run python src/eutils_stub.py [port] [abstracts.json]
+    EUTILS_BASE=http://localhost:8765 poetry run python src/rag.py
+
+abstracts.json is an optional {"<pmid>": "<abstract text>"} mapping. PMIDs that are not in
+it get a generated placeholder abstract, except those ending in 0, which are returned without one.
+"""
+import sys
+import json
+import logging
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from xml.sax.saxutils import escape
+
+DEFAULT_PORT = 8765
+
+def render_efetch_xml(pmids, abstracts):
+    """Render a PubmedArticleSet document in the shape efetch returns for rettype=abstract."""
+    parts = ['<?xml version="1.0" ?>\n<PubmedArticleSet>']
+    for pmid in pmids:
+        abstract = abstracts.get(pmid)
+        if abstract is None and not pmid.endswith("0"):
+            abstract = f"Placeholder abstract for PubMed ID {pmid}."
+        abstract_xml = (
+            f"<Abstract><AbstractText>{escape(abstract)}</AbstractText></Abstract>" if abstract else ""
+        )
+        parts.append(
+            "<PubmedArticle><MedlineCitation>"
+            f"<PMID Version=\"1\">{escape(pmid)}</PMID>"
+            f"<Article><ArticleTitle>Article {escape(pmid)}</ArticleTitle>{abstract_xml}</Article>"
+            "</MedlineCitation></PubmedArticle>"
+        )
+    parts.append("</PubmedArticleSet>")
+    return "".join(parts).encode("utf-8")
+
+def make_handler(abstracts):
+    class EfetchHandler(BaseHTTPRequestHandler):
+        def _respond(self, params):
+            if urlparse(self.path).path.rstrip("/").split("/")[-1] != "efetch.fcgi":
+                self.send_error(404)
+                return
+            ids = params.get("id", [""])[0]
+            pmids = [p.strip() for p in ids.split(",") if p.strip()]
+            body = render_efetch_xml(pmids, abstracts)
+            self.send_response(200)
+            self.send_header("Content-Type", "text/xml; charset=UTF-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            self._respond(parse_qs(urlparse(self.path).query))
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            self._respond(parse_qs(self.rfile.read(length).decode("utf-8")))
+
+    return EfetchHandler
+
+def serve(port=DEFAULT_PORT, abstracts=None):
+    """Create (but do not start) a stand-in server; call serve_forever() on the result."""
+    return ThreadingHTTPServer(("127.0.0.1", port), make_handler(abstracts or {}))
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PORT
+    abstracts = {}
+    if len(sys.argv) > 2:
+        with open(sys.argv[2], "r") as f:
+            abstracts = json.load(f)
+    server = serve(port, abstracts)
+    logging.info(f"E-utilities stand-in listening on http://127.0.0.1:{port}")
+    server.serve_forever()
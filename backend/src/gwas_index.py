@@ -0,0 +1,275 @@
+"""
+GWAS index module: a compact, memory-mapped rsID -> associations index built from the
+GWAS Catalog bulk associations TSV, for offline lookups without rate limits or truncation.
+
+Usage:
+    poetry run python src/gwas_index.py build gwas_catalog_associations.tsv[.gz|.zip]
+    poetry run python src/gwas_index.py lookup rs1801133
+"""
+import os
+import io
+import re
+import csv
+import sys
+import gzip
+import json
+import mmap
+import time
+import shutil
+import struct
+import bisect
+import heapq
+import logging
+import zipfile
+import tempfile
+import threading
+from itertools import groupby
+from operator import itemgetter
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from cache import CACHE_DIR
+
+GWAS_INDEX_DIR = os.getenv("GWAS_INDEX_DIR", os.path.join(CACHE_DIR, "gwas_index"))
+DATA_FILE = "associations.jsonl"
+INDEX_FILE = "rsid.idx"
+# Names the build directory (inside GWAS_INDEX_DIR) holding the live DATA_FILE/INDEX_FILE pair
+CURRENT_FILE = "CURRENT"
+# One index entry per rsID: numeric rsID, byte offset and length of its line in DATA_FILE
+INDEX_ENTRY = struct.Struct("<QQI")
+# Associations held in memory per sorted run while building; runs are merged from disk
+BUILD_RUN_SIZE = int(os.getenv("GWAS_INDEX_BUILD_RUN_SIZE", "200000"))
+
+_RSID_RE = re.compile(r"rs(\d+)", re.I)
+_PVALUE_RE = re.compile(r"^\s*([0-9.]+)\s*[Ee]\s*([-+]?\d+)\s*$")
+
+def _open_tsv(path: str) -> io.TextIOBase:
+    if path.endswith(".zip"):
+        archive = zipfile.ZipFile(path)
+        member = next(name for name in archive.namelist() if name.endswith((".tsv", ".txt")))
+        return io.TextIOWrapper(archive.open(member), encoding="utf-8")
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+def _parse_float(value: str) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def _risk_alleles_by_rsid(row: Dict[str, str], rsids: List[int]) -> Dict[int, List[Dict[str, str]]]:
+    """
+    Split a row's risk alleles ("rs1-A; rs2-G" or "rs1-A x rs2-T" for multi-SNP rows) by the
+    rsID each one names. Alleles that name no rsID only belong to single-SNP rows.
+    """
+    by_rsid: Dict[int, List[Dict[str, str]]] = {rsid: [] for rsid in rsids}
+    for allele in re.split(r";| x ", row.get("STRONGEST SNP-RISK ALLELE", "")):
+        allele = allele.strip()
+        if not allele:
+            continue
+        match = _RSID_RE.match(allele)
+        if match:
+            targets = [int(match.group(1))] if int(match.group(1)) in by_rsid else []
+        else:
+            targets = rsids if len(rsids) == 1 else []
+        for rsid in targets:
+            by_rsid[rsid].append({"key": allele, "label": allele})
+    return by_rsid
+
+def row_to_associations(row: Dict[str, str]) -> List[Tuple[int, Dict[str, Any]]]:
+    """
+    Convert one catalog TSV row into the association shape returned by the GWAS REST API
+    (traitName, riskAllele, pValue/pValueExponent, orValue or beta, pubmedId), so the RAG
+    allele matching works unchanged. A multi-SNP row gives one association per numeric
+    rsID, each carrying only that rsID's risk alleles.
+    """
+    rsids = list(dict.fromkeys(int(n) for n in _RSID_RE.findall(row.get("SNPS", ""))))
+    association: Dict[str, Any] = {
+        "traitName": [row.get("DISEASE/TRAIT") or row.get("MAPPED_TRAIT") or "N/A"],
+        "pubmedId": row.get("PUBMEDID") or "N/A",
+    }
+    match = _PVALUE_RE.match(row.get("P-VALUE", ""))
+    if match:
+        mantissa = float(match.group(1))
+        association["pValue"] = int(mantissa) if mantissa.is_integer() else mantissa
+        association["pValueExponent"] = int(match.group(2))
+
+    effect = _parse_float(row.get("OR or BETA", ""))
+    if effect is not None:
+        # The catalog shares one column between odds ratios and betas; betas carry a direction in the CI text
+        ci_text = row.get("95% CI (TEXT)", "").lower()
+        if "increase" in ci_text or "decrease" in ci_text:
+            association["beta"] = -effect if "decrease" in ci_text else effect
+        else:
+            association["orValue"] = effect
+    return [
+        (rsid, {**association, "riskAllele": alleles})
+        for rsid, alleles in _risk_alleles_by_rsid(row, rsids).items()
+    ]
+
+def _pvalue_sort_key(association: Dict[str, Any]) -> float:
+    if "pValue" not in association:
+        return float("inf")
+    return float(association["pValue"]) * 10.0 ** association["pValueExponent"]
+
+def current_version(index_dir: str = GWAS_INDEX_DIR) -> Optional[str]:
+    """Return the name of the live build directory, or None if no index has been built."""
+    try:
+        with open(os.path.join(index_dir, CURRENT_FILE), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def _write_run(records: List[Tuple[int, str]], run_dir: str, run_number: int) -> str:
+    """Sort (rsid, association JSON) records by rsID and spill them to a run file."""
+    records.sort(key=itemgetter(0))
+    path = os.path.join(run_dir, f"run-{run_number}.tsv")
+    with open(path, "w", encoding="utf-8") as f:
+        for rsid, association in records:
+            f.write(f"{rsid}\t{association}\n")
+    return path
+
+def _read_run(path: str) -> Iterator[Tuple[int, str]]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            rsid, association = line.rstrip("\n").split("\t", 1)
+            yield int(rsid), association
+
+def build_index(tsv_path: str, index_dir: str = GWAS_INDEX_DIR) -> int:
+    """
+    Build (or refresh) the index from a GWAS Catalog associations dump.
+    The catalog is streamed: associations are spilled to disk in sorted runs of
+    BUILD_RUN_SIZE, and the runs are merged by rsID, so memory stays bounded by one run
+    plus one rsID's associations however large the dump is.
+    Both files are written into a new build directory, which is then made live by
+    atomically replacing CURRENT_FILE, so readers always see a matching data/index pair.
+    Older builds are removed afterwards; indexes that are already open keep their mappings.
+    Returns:
+        int: Number of distinct rsIDs indexed.
+    """
+    version = f"build-{time.time_ns()}"
+    build_dir = os.path.join(index_dir, version)
+    os.makedirs(build_dir)
+    count = 0
+    with tempfile.TemporaryDirectory(dir=build_dir) as run_dir:
+        runs: List[str] = []
+        records: List[Tuple[int, str]] = []
+        rows = 0
+        with _open_tsv(tsv_path) as f:
+            for row in csv.DictReader(f, delimiter="\t"):
+                rows += 1
+                for rsid, association in row_to_associations(row):
+                    records.append((rsid, json.dumps(association, separators=(",", ":"))))
+                if len(records) >= BUILD_RUN_SIZE:
+                    runs.append(_write_run(records, run_dir, len(runs)))
+                    records = []
+        if records:
+            runs.append(_write_run(records, run_dir, len(runs)))
+        logging.info(f"Read {rows} catalog rows into {len(runs)} sorted runs")
+
+        with open(os.path.join(build_dir, DATA_FILE), "wb") as data_out, \
+                open(os.path.join(build_dir, INDEX_FILE), "wb") as index_out:
+            offset = 0
+            merged = heapq.merge(*(_read_run(path) for path in runs), key=itemgetter(0))
+            for rsid, group in groupby(merged, key=itemgetter(0)):
+                associations = sorted((json.loads(association) for _, association in group), key=_pvalue_sort_key)
+                line = json.dumps(associations, separators=(",", ":")).encode("utf-8") + b"\n"
+                data_out.write(line)
+                index_out.write(INDEX_ENTRY.pack(rsid, offset, len(line)))
+                offset += len(line)
+                count += 1
+    logging.info(f"Indexed {count} rsIDs")
+
+    current_tmp = os.path.join(index_dir, CURRENT_FILE + ".tmp")
+    with open(current_tmp, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(current_tmp, os.path.join(index_dir, CURRENT_FILE))
+
+    for name in os.listdir(index_dir):
+        if name != version and name.startswith("build-"):
+            shutil.rmtree(os.path.join(index_dir, name), ignore_errors=True)
+    return count
+
+class _IndexKeys:
+    """Sequence view over the numeric rsIDs in the mapped index, for bisect."""
+    def __init__(self, index_map: mmap.mmap) -> None:
+        self._map = index_map
+        self._count = len(index_map) // INDEX_ENTRY.size
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, i: int) -> int:
+        return struct.unpack_from("<Q", self._map, i * INDEX_ENTRY.size)[0]
+
+class GWASIndex:
+    """
+    Read-only, memory-mapped GWAS Catalog index. A lookup is a binary search over
+    fixed-width index entries plus one JSON decode of the matching data line.
+    """
+    def __init__(self, index_dir: str) -> None:
+        """
+        Args:
+            index_dir (str): A build directory holding DATA_FILE and INDEX_FILE.
+        """
+        self.index_dir = index_dir
+        with open(os.path.join(index_dir, INDEX_FILE), "rb") as f:
+            self._index_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        with open(os.path.join(index_dir, DATA_FILE), "rb") as f:
+            self._data_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._keys = _IndexKeys(self._index_map)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def lookup(self, rsid: str) -> List[Dict[str, Any]]:
+        """
+        Return every catalog association for an rsID, sorted by p-value (ascending),
+        in the GWAS REST API association shape. Unknown rsIDs return an empty list.
+        """
+        match = _RSID_RE.fullmatch(rsid.strip())
+        if not match:
+            return []
+        key = int(match.group(1))
+        i = bisect.bisect_left(self._keys, key)
+        if i >= len(self._keys) or self._keys[i] != key:
+            return []
+        _, offset, length = INDEX_ENTRY.unpack_from(self._index_map, i * INDEX_ENTRY.size)
+        return json.loads(self._data_map[offset : offset + length])
+
+_gwas_index: Optional[GWASIndex] = None
+_gwas_index_version: Optional[str] = None
+_gwas_index_lock = threading.Lock()
+
+def get_gwas_index() -> Optional[GWASIndex]:
+    """
+    Return the process-wide index for the live build in GWAS_INDEX_DIR, or None if none has
+    been built. The index is reopened when a rebuild has swapped in a new build.
+    """
+    global _gwas_index, _gwas_index_version
+    version = current_version()
+    with _gwas_index_lock:
+        if version != _gwas_index_version:
+            _gwas_index, _gwas_index_version = None, version
+            if version is not None:
+                try:
+                    _gwas_index = GWASIndex(os.path.join(GWAS_INDEX_DIR, version))
+                except (OSError, ValueError) as e:
+                    logging.warning(f"Could not open GWAS index build {version} in {GWAS_INDEX_DIR}: {e}")
+        return _gwas_index
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) < 3 or sys.argv[1] not in ("build", "lookup"):
+        print("Usage: poetry run python src/gwas_index.py build <associations.tsv[.gz|.zip]>\n"
+              "       poetry run python src/gwas_index.py lookup <rsID> [<rsID> ...]")
+        sys.exit(1)
+    if sys.argv[1] == "build":
+        count = build_index(sys.argv[2])
+        print(f"Indexed {count} rsIDs into {GWAS_INDEX_DIR}")
+    else:
+        index = get_gwas_index()
+        if index is None:
+            print(f"No GWAS index found in {GWAS_INDEX_DIR}; run the build command first.")
+            sys.exit(1)
+        for rsid in sys.argv[2:]:
+            print(json.dumps({rsid: index.lookup(rsid)}, indent=2))
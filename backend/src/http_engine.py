@@ -0,0 +1,293 @@
+"""
+HTTP engine module providing one shared asyncio client for every outbound request
+(VEP, GWAS Catalog, PubMed and image lookups).
+"""
+import os
+import asyncio
+import atexit
+import logging
+import random
+import threading
+import time
+from concurrent.futures import Future
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar, Union
+from urllib.parse import urlparse
+import httpx
+from singleton import process_wide
+
+T = TypeVar("T")
+
+# Maximum concurrent requests per host; hosts not listed use DEFAULT_HOST_CONCURRENCY
+HOST_CONCURRENCY = {
+    "rest.ensembl.org": 30,
+    "www.ebi.ac.uk": 20,
+    "eutils.ncbi.nlm.nih.gov": 3,
+    "www.bing.com": 10,
+}
+DEFAULT_HOST_CONCURRENCY = 10
+# Sustained requests per second per host, enforced by a token bucket shared by every job and
+# pipeline stage in the process; hosts not listed are not rate limited. Override with
+# HOST_RATE_LIMITS="host=rate,host=rate".
+HOST_RATE_LIMITS = {
+    "rest.ensembl.org": 15.0,
+    "www.ebi.ac.uk": 10.0,
+    # NCBI allows 10 requests per second with an API key and 3 without
+    "eutils.ncbi.nlm.nih.gov": 10.0 if os.getenv("NCBI_API_KEY") else 3.0,
+    "www.bing.com": 5.0,
+}
+# Requests a host's bucket lets through back to back after being idle; 1 spaces every
+# request evenly, so no one-second window ever exceeds the rate
+DEFAULT_BURST = float(os.getenv("HOST_RATE_BURST", "1"))
+MAX_CONNECTIONS = 200
+MAX_KEEPALIVE_CONNECTIONS = 50
+DEFAULT_TIMEOUT = 30.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+DEFAULT_MAX_ATTEMPTS = 5
+# Never wait longer than this for a server-requested Retry-After
+MAX_RETRY_AFTER = 120.0
+
+# Called after every attempt with the response (None on a transport error) and its latency in seconds
+ResponseObserver = Callable[[Optional[httpx.Response], float], None]
+
+def parse_rate_limits(spec: str) -> Dict[str, float]:
+    """Parse "host=rate,host=rate" into a rate per host."""
+    limits: Dict[str, float] = {}
+    for item in spec.split(","):
+        if "=" in item:
+            host, rate = item.split("=", 1)
+            limits[host.strip()] = float(rate)
+    return limits
+
+class TokenBucket:
+    """
+    Asyncio token bucket refilled at rate tokens per second up to burst. Waiters are served
+    in arrival order (asyncio.Lock is FIFO), so the host sees a steady rate rather than
+    bursts of retries. Records how long requests queued for a token.
+    """
+    def __init__(self, rate: float, burst: float = DEFAULT_BURST) -> None:
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+        self.acquired = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _refill(self, now: float) -> None:
+        if now > self._updated:
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+    async def acquire(self) -> float:
+        """Wait for a token; returns the seconds spent waiting."""
+        started = time.monotonic()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    break
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+        waited = time.monotonic() - started
+        self.acquired += 1
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+        return waited
+
+    def pause(self, seconds: float) -> None:
+        """Hold every waiter for seconds (e.g. a server's Retry-After), then resume at the normal rate."""
+        now = time.monotonic()
+        self._paused_until = max(self._paused_until, now + seconds)
+        self._tokens = 0.0
+        self._updated = self._paused_until
+
+def retry_after_seconds(response: httpx.Response) -> Optional[float]:
+    """
+    Return how long the server asked us to wait, from Retry-After (seconds or HTTP date)
+    or from an exhausted X-RateLimit-Remaining / X-RateLimit-Reset pair. None if unspecified.
+    """
+    retry_after = response.headers.get("Retry-After")
+    if retry_after:
+        try:
+            return min(max(float(retry_after), 0.0), MAX_RETRY_AFTER)
+        except ValueError:
+            try:
+                delay = parsedate_to_datetime(retry_after).timestamp() - time.time()
+                return min(max(delay, 0.0), MAX_RETRY_AFTER)
+            except (TypeError, ValueError):
+                pass
+    if response.headers.get("X-RateLimit-Remaining") == "0":
+        try:
+            return min(max(float(response.headers.get("X-RateLimit-Reset", "")), 0.0), MAX_RETRY_AFTER)
+        except ValueError:
+            pass
+    return None
+
+class HTTPEngine:
+    """
+    Runs a single asyncio event loop on a background thread, with a pooled keep-alive
+    httpx.AsyncClient, a semaphore per host and, for rate-limited hosts, a token bucket.
+    Synchronous code hands coroutines to run() or submit(); retries back off with
+    asyncio.sleep, so waiting requests hold no threads.
+    """
+    def __init__(self, host_concurrency: Optional[Dict[str, int]] = None,
+                 host_rate_limits: Optional[Dict[str, float]] = None) -> None:
+        self.host_concurrency = dict(HOST_CONCURRENCY, **(host_concurrency or {}))
+        self.host_rate_limits = dict(
+            HOST_RATE_LIMITS, **parse_rate_limits(os.getenv("HOST_RATE_LIMITS", "")), **(host_rate_limits or {})
+        )
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._buckets: Dict[str, TokenBucket] = {}
+        # Per-host request counters for stats(): attempts sent, 429 responses, queue wait
+        self._host_stats: Dict[str, Dict[str, float]] = {}
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="http-engine", daemon=True)
+        self._thread.start()
+        self.client: httpx.AsyncClient = self.run(self._create_client())
+
+    async def _create_client(self) -> httpx.AsyncClient:
+        limits = httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS)
+        return httpx.AsyncClient(limits=limits, timeout=DEFAULT_TIMEOUT, follow_redirects=True)
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        return self._loop
+
+    def run(self, coro: Awaitable[T], timeout: Optional[float] = None) -> T:
+        """Run a coroutine on the engine loop and block the calling thread until it finishes."""
+        return self.submit(coro).result(timeout)
+
+    def submit(self, coro: Awaitable[T]) -> "Future[T]":
+        """Schedule a coroutine on the engine loop and return a concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def _semaphore(self, host: str) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(host)
+        if semaphore is None:
+            limit = self.host_concurrency.get(host, DEFAULT_HOST_CONCURRENCY)
+            semaphore = self._semaphores[host] = asyncio.Semaphore(limit)
+        return semaphore
+
+    def _bucket(self, host: str) -> Optional[TokenBucket]:
+        bucket = self._buckets.get(host)
+        if bucket is None and self.host_rate_limits.get(host):
+            bucket = self._buckets[host] = TokenBucket(self.host_rate_limits[host])
+        return bucket
+
+    def _record(self, host: str, waited: float) -> Dict[str, float]:
+        stats = self._host_stats.setdefault(
+            host, {"requests": 0, "throttled": 0, "queue_wait_total": 0.0, "queue_wait_max": 0.0}
+        )
+        stats["requests"] += 1
+        stats["queue_wait_total"] += waited
+        stats["queue_wait_max"] = max(stats["queue_wait_max"], waited)
+        return stats
+
+    def stats(self) -> Dict[str, Dict[str, Union[int, float, None]]]:
+        """
+        Per-host request statistics since start-up: attempts sent, 429 responses, configured
+        rate, and mean and maximum queue wait (for a concurrency slot and a rate token) in seconds.
+        """
+        report: Dict[str, Dict[str, Union[int, float, None]]] = {}
+        for host, stats in list(self._host_stats.items()):
+            requests = int(stats["requests"])
+            report[host] = {
+                "requests": requests,
+                "throttled": int(stats["throttled"]),
+                "rate_limit": self.host_rate_limits.get(host),
+                "queue_wait_mean": round(stats["queue_wait_total"] / requests, 4) if requests else 0.0,
+                "queue_wait_max": round(stats["queue_wait_max"], 4),
+            }
+        return report
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        *,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        stream: bool = False,
+        observer: Optional[ResponseObserver] = None,
+        **kwargs: Any,
+    ) -> httpx.Response:
+        """
+        Send a request within the host's concurrency limit and rate limit, retrying 429/5xx
+        responses, connection errors and timeouts. Every attempt takes a token from the host's
+        bucket. Retries wait for the server's Retry-After when given (which also pauses the
+        host's bucket, so other requests do not run into the same limit), otherwise for an
+        exponential backoff with jitter.
+        Args:
+            method (str): HTTP method.
+            url (str): Absolute URL.
+            max_attempts (int): Total attempts before giving up.
+            stream (bool): Return before the body is read; the caller must aclose() the response.
+            observer (Optional[ResponseObserver]): Called after every attempt, e.g. by a rate controller.
+            **kwargs: Passed to httpx.AsyncClient.build_request (params, json, data, headers, timeout).
+        Returns:
+            httpx.Response: The final response, which may still carry an error status.
+        Raises:
+            httpx.TransportError: If every attempt failed at the transport level.
+        """
+        host = urlparse(url).netloc
+        bucket = self._bucket(host)
+        for attempt in range(1, max_attempts + 1):
+            queued = time.monotonic()
+            try:
+                async with self._semaphore(host):
+                    if bucket is not None:
+                        await bucket.acquire()
+                    started = time.monotonic()
+                    host_stats = self._record(host, started - queued)
+                    response = await self.client.send(self.client.build_request(method, url, **kwargs), stream=stream)
+            except httpx.TransportError as e:
+                if observer:
+                    observer(None, time.monotonic() - started)
+                if attempt >= max_attempts:
+                    raise
+                sleep_time = (2 ** attempt) + random.uniform(0, 1)
+                logging.warning(f"{method} {host}: {type(e).__name__}. Retrying in {sleep_time:.2f} seconds (attempt {attempt})...")
+                await asyncio.sleep(sleep_time)
+                continue
+
+            if observer:
+                observer(response, time.monotonic() - started)
+            if response.status_code == 429:
+                host_stats["throttled"] += 1
+            if response.status_code in RETRY_STATUSES and attempt < max_attempts:
+                await response.aclose()
+                sleep_time = retry_after_seconds(response)
+                if response.status_code == 429 and bucket is not None and sleep_time is not None:
+                    bucket.pause(sleep_time)
+                if sleep_time is None:
+                    sleep_time = (2 ** attempt) + random.uniform(0, 1)
+                logging.warning(f"{method} {host}: HTTP {response.status_code}. Retrying in {sleep_time:.2f} seconds (attempt {attempt})...")
+                await asyncio.sleep(sleep_time)
+                continue
+            return response
+        raise RuntimeError("unreachable")
+
+    def close(self) -> None:
+        """Close the client and stop the event loop."""
+        if self._loop.is_closed():
+            return
+        try:
+            self.run(self.client.aclose(), timeout=5)
+        except Exception as e:
+            logging.debug(f"Error closing HTTP client: {e}")
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        self._loop.close()
+
+@process_wide
+def get_engine() -> HTTPEngine:
+    """Return the process-wide HTTP engine, starting it on first use."""
+    engine = HTTPEngine()
+    atexit.register(engine.close)
+    return engine
@@ -0,0 +1,57 @@
+"""
+Image cache module: trait title -> image URL lookups stored persistently, including
+negative entries for titles the image search found nothing for.
+"""
+import os
+import time
+from typing import Dict, Iterable, Optional
+from cache import KVCache
+from singleton import process_wide
+
+# Found image URLs are reused for this long
+IMAGE_CACHE_TTL_DAYS = float(os.getenv("IMAGE_CACHE_TTL_DAYS", "30"))
+# Titles without an image are not searched again for this long
+IMAGE_MISS_TTL_HOURS = float(os.getenv("IMAGE_MISS_TTL_HOURS", "24"))
+
+def image_key(trait_title: str) -> str:
+    """Normalise a trait title into a cache key."""
+    return " ".join(trait_title.split()).casefold()
+
+class ImageCache:
+    """
+    Image URLs per normalised trait title. A miss is stored as a None URL with its lookup
+    time and expires after IMAGE_MISS_TTL_HOURS; found URLs expire after IMAGE_CACHE_TTL_DAYS.
+    """
+    def __init__(self) -> None:
+        self._store = KVCache("trait_images", ttl=IMAGE_CACHE_TTL_DAYS * 86400)
+
+    def get_many(self, trait_titles: Iterable[str]) -> Dict[str, Optional[str]]:
+        """
+        Look up cached images for trait titles.
+        Args:
+            trait_titles (Iterable[str]): Trait titles.
+        Returns:
+            Dict[str, Optional[str]]: URL (or None for a cached miss) per title; titles
+                that were never looked up, or whose miss has expired, are absent.
+        """
+        keys = {title: image_key(title) for title in trait_titles}
+        found = self._store.get_many(keys.values())
+        miss_ttl = IMAGE_MISS_TTL_HOURS * 3600
+        images: Dict[str, Optional[str]] = {}
+        for title, key in keys.items():
+            entry = found.get(key)
+            if entry is None:
+                continue
+            if entry["url"] is None and time.time() - entry["checked"] > miss_ttl:
+                continue
+            images[title] = entry["url"]
+        return images
+
+    def put(self, trait_title: str, url: Optional[str]) -> None:
+        """Record a lookup result; url None records that the search found no image."""
+        self._store.put(image_key(trait_title), {"url": url, "checked": time.time()})
+
+@process_wide
+def get_image_cache() -> ImageCache:
+    """Return the process-wide image cache, opening it on first use."""
+    return ImageCache()
@@ -0,0 +1,174 @@
+"""
+Jobs module for running VCF analyses concurrently on a bounded worker pool, with
+per-job state, progress and results.
+"""
+import os
+import time
+import asyncio
+import uuid
+import logging
+import threading
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+from http_engine import get_engine
+from models import TraitSummary
+from progress import get_progress_bus
+from result_cache import get_result_cache
+
+# Analyses run at the same time; further jobs wait in the pool's queue
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "2"))
+# Finished jobs kept for /status_poll and /results; older ones are forgotten first
+MAX_FINISHED_JOBS = int(os.getenv("MAX_FINISHED_JOBS", "100"))
+
+class Job:
+    """
+    State of one analysis: status, error and results; its progress is published under its job ID.
+    Results are published as soon as they are summarised; trait images that were not cached
+    are resolved afterwards (images_pending) and filled into the results in place.
+    """
+    def __init__(self, filename: str, file_path: str, sha256: Optional[str] = None) -> None:
+        self.job_id = uuid.uuid4().hex
+        self.filename = filename
+        self.file_path = file_path
+        # Content hash of the input, when known (hash-named uploads)
+        self.sha256 = sha256
+        # True when the results were served from the result cache
+        self.cached = False
+        # True while trait images are still being resolved after completion
+        self.images_pending = False
+        self.status = "queued"
+        self.error: Optional[str] = None
+        self.results: List[TraitSummary] = []
+        # Associations behind the results, without abstract text, for chat retrieval
+        self.associations: List[Dict[str, Any]] = []
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.lock = threading.Lock()
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("completed", "error")
+
+    def read_progress(self) -> Dict[str, Any]:
+        """Return this job's latest progress record, or {} if none has been published yet."""
+        return get_progress_bus().latest(self.job_id) or {}
+
+    def _set_status(self, status: str, **fields: Any) -> None:
+        with self.lock:
+            self.status = status
+            for name, value in fields.items():
+                setattr(self, name, value)
+        get_progress_bus().notify(self.job_id)
+
+    def run(self) -> None:
+        """Run the streaming pipeline and summarisation for this job's file."""
+        from rag import RAG
+        self._set_status("starting", started=time.time())
+        try:
+            # Results are published without waiting for uncached trait images
+            rag = RAG(progress_topic=self.job_id, resolve_images=False)
+            self._set_status("vep_annotation")
+            results = rag.process_vcf_file(self.file_path)
+        except Exception as e:
+            error_msg = f"Error: {e}\n{traceback.format_exc()}"
+            logging.error(f"Job {self.job_id} failed: {error_msg}")
+            self._set_status("error", error=error_msg, finished=time.time())
+            return
+        associations = [
+            {name: value for name, value in association.items() if name != "abstract"}
+            for association in rag.associations
+        ]
+        missing = self._missing_images(results)
+        self._set_status(
+            "completed", results=list(results), associations=associations,
+            finished=time.time(), images_pending=bool(missing),
+        )
+        if associations:
+            # Embed new abstracts now, so the first chat question does not wait for them
+            from chat import index_abstracts_async
+            get_engine().submit(index_abstracts_async(associations))
+        if missing:
+            get_engine().submit(self.resolve_images_async(missing))
+        else:
+            self._cache_results()
+
+    @staticmethod
+    def _missing_images(results: List[TraitSummary]) -> List[str]:
+        return [summary.trait_title for summary in results if summary.image_url is None]
+
+    async def resolve_images_async(self, trait_titles: List[str]) -> None:
+        """
+        Fill in images for the given trait titles on the shared HTTP engine after the job
+        has completed, then store the results in the result cache.
+        """
+        from agent import Agent
+        images: Dict[str, Optional[str]] = {}
+        try:
+            images = await Agent().find_images_async(trait_titles)
+        except Exception as e:
+            logging.warning(f"Image resolution failed for job {self.job_id}: {e}")
+        resolved = {title: url for title, url in images.items() if url}
+        with self.lock:
+            self.results = [
+                summary.model_copy(update={"image_url": resolved[summary.trait_title]})
+                if summary.image_url is None and summary.trait_title in resolved else summary
+                for summary in self.results
+            ]
+        if resolved or not self.cached:
+            await asyncio.to_thread(self._cache_results)
+        self._set_status(self.status, images_pending=False)
+
+    def _cache_results(self) -> None:
+        with self.lock:
+            results = list(self.results)
+            associations = list(self.associations)
+        if self.sha256 and results:
+            # Empty result sets are not cached: they may come from a failed summarisation
+            get_result_cache().put(self.sha256, results, associations)
+
+class JobManager:
+    """Registry of analysis jobs, run on a ThreadPoolExecutor of ANALYSIS_WORKERS threads."""
+    def __init__(self, max_workers: int = ANALYSIS_WORKERS) -> None:
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="analysis")
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, filename: str, file_path: str, sha256: Optional[str] = None) -> Job:
+        """
+        Register a job for an uploaded file and queue it on the worker pool. If results for
+        the same content and pipeline configuration are cached, the job completes immediately.
+        """
+        job = Job(filename, file_path, sha256)
+        cached = get_result_cache().get(sha256) if sha256 else None
+        if cached is not None:
+            job.results, job.associations = cached
+            job.cached = True
+            job.status = "completed"
+            job.started = job.finished = time.time()
+            job.images_pending = bool(job._missing_images(job.results))
+        with self._lock:
+            self._jobs[job.job_id] = job
+            self._evict_finished()
+        if job.cached:
+            logging.info(f"Analysis job {job.job_id} for {filename} served from the result cache")
+            if job.images_pending:
+                # Images that were not found when the results were cached may be found now
+                get_engine().submit(job.resolve_images_async(job._missing_images(job.results)))
+        else:
+            self._executor.submit(job.run)
+            logging.info(f"Queued analysis job {job.job_id} for {filename}")
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Return a job by ID, or None if it is unknown or has been evicted."""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _evict_finished(self) -> None:
+        finished = [job_id for job_id, job in self._jobs.items() if job.done]
+        for job_id in finished[: max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+            get_progress_bus().discard(job_id)
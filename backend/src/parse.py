@@ -1,12 +1,12 @@
 """
 VCFParser module for parsing and annotating VCF files.
 """
-import os
-import json
 import logging
+from itertools import islice
 from typing import Optional, Any
 import vcfpy
-from vep import process_vcf_file_parallel
+from vep import process_vcf_file_parallel, iter_vcf_variants
+from csq import annotate_locally
 
 class VCFParser:
     """
@@ -25,16 +25,16 @@ class VCFParser:
 
     def fetch_vep_annotation(self) -> None:
         """
-        Run VEP annotation and store the result in self.annotation.
+        Run VEP annotation and store the (projected) result in self.annotation.
+        VCFs that already carry CSQ/ANN consequences are annotated offline instead.
         """
         try:
-            output_path = 'src/annotation.json'
-            process_vcf_file_parallel(self.vcf_path, output_path)
-            if not os.path.exists(output_path):
-                raise FileNotFoundError(f"Annotation file not found at {output_path}")
-            with open(output_path, 'r') as f:
-                self.annotation = json.load(f)
-                logging.info(f"Successfully loaded {len(self.annotation)} annotations")
+            self.annotation = annotate_locally(self.vcf_path)
+            if self.annotation is None:
+                self.annotation = process_vcf_file_parallel(self.vcf_path)
+            if self.annotation is None:
+                raise RuntimeError(f"VEP annotation produced no result for {self.vcf_path}")
+            logging.info(f"Successfully loaded {len(self.annotation)} annotations")
         except Exception as e:
             logging.error(f"Error fetching VEP annotation: {str(e)}")
             self.annotation = []
@@ -43,18 +43,19 @@ class VCFParser:
     def load(self) -> Optional[Any]:
         """
         Load the VCF or RData file.
+        VCF input (plain or gzip) is not read here; a lazy iterator over its
+        variant lines is returned instead so large files never sit in memory.
         Returns:
-            File content or object.
+            Iterator of VEP input strings, or the loaded R object.
         """
         if not self.vcf_path:
             raise ValueError("vcf_path is not set")
-        if self.vcf_path.endswith('.vcf'):
-            with open(self.vcf_path, 'r') as f:
-                return f.read()
+        if self.vcf_path.endswith(('.vcf', '.vcf.gz')):
+            return iter_vcf_variants(self.vcf_path)
         elif self.vcf_path.endswith('.rdata'):
             return self.parse_rdata()
         else:
-            raise ValueError("vcf_path must end with .vcf or .rdata")
+            raise ValueError("vcf_path must end with .vcf, .vcf.gz or .rdata")
 
     def parse_rdata(self) -> Any:
         """
@@ -74,4 +75,4 @@ class VCFParser:
 if __name__ == '__main__':
     logging.basicConfig(level=logging.INFO)
     parser = VCFParser('data/truncated.vcf')
-    print(parser.vcf_file)
\ No newline at end of file
+    print(list(islice(parser.vcf_file, 5)))
\ No newline at end of file
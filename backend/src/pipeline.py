@@ -0,0 +1,208 @@
+"""
+Pipeline module that runs VEP annotation, damaging-variant filtering, GWAS lookups and
+PubMed retrieval as overlapping stages connected by bounded queues.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+from vep import stream_vep_annotations
+from csq import detect_consequence_field, iter_local_annotation_batches
+from rag import RAG, PUBMED_EFETCH_BATCH_SIZE
+from vcf_reader import VCFReader
+
+# Bounded queues between stages; a full queue pauses the upstream stage (backpressure)
+VARIANT_QUEUE_SIZE = 1000
+PMID_QUEUE_SIZE = 1000
+# Concurrent consumers per stage; requests are further bounded per host by the HTTP engine
+GWAS_STAGE_WORKERS = 20
+PUBMED_STAGE_WORKERS = 3
+# How long the PubMed stage waits to fill an efetch batch before sending a partial one
+PMID_BATCH_LINGER = 0.5
+
+_DONE = object()
+
+class StreamingPipeline:
+    """
+    Streaming stage graph for one VCF file:
+
+        VEP batches -> damaging filter -> GWAS lookups -> PubMed abstracts
+
+    Each completed VEP batch is filtered immediately and new (gene, rsID, allele) tuples are
+    queued for the GWAS stage; new PMIDs found by GWAS lookups are queued for the PubMed stage.
+    End-to-end time approaches that of the slowest stage rather than the sum of all stages.
+    Must be run on the HTTP engine's event loop.
+    """
+    def __init__(self, rag: RAG, max_workers: int = 30) -> None:
+        self.rag = rag
+        self.max_workers = max_workers
+        self.associations: List[Dict[str, Any]] = []
+        self.abstracts: Dict[str, Optional[str]] = {}
+        self._seen_variants: Set[Tuple[str, str, str]] = set()
+        self._seen_pmids: Set[str] = set()
+        self._counts = {
+            "vep_done": 0, "vep_total": 0, "vep_finished": False,
+            "gwas_done": 0, "gwas_total": 0, "gwas_finished": False,
+            "pubmed_done": 0, "pubmed_total": 0,
+        }
+
+    async def run(self, vcf_path: str) -> List[Dict[str, Any]]:
+        """
+        Run every stage to completion.
+        Returns:
+            List[Dict[str, Any]]: GWAS association records with an 'abstract' key.
+        """
+        start_time = time.time()
+        variant_queue: asyncio.Queue = asyncio.Queue(VARIANT_QUEUE_SIZE)
+        pmid_queue: asyncio.Queue = asyncio.Queue(PMID_QUEUE_SIZE)
+
+        gwas_workers = [
+            asyncio.create_task(self._gwas_stage(variant_queue, pmid_queue)) for _ in range(GWAS_STAGE_WORKERS)
+        ]
+        pubmed_stage = asyncio.create_task(self._pubmed_stage(pmid_queue))
+        try:
+            await self._vep_stage(vcf_path, variant_queue)
+            for _ in gwas_workers:
+                await variant_queue.put(_DONE)
+            await asyncio.gather(*gwas_workers)
+            self._counts["gwas_finished"] = True
+            self._report()
+            await pmid_queue.put(_DONE)
+            await pubmed_stage
+        finally:
+            for task in (*gwas_workers, pubmed_stage):
+                task.cancel()
+
+        for assoc in self.associations:
+            pmid = assoc.get("pubmedId")
+            assoc["abstract"] = self.abstracts.get(str(pmid)) if pmid and pmid != "N/A" else None
+        num_with_abstracts = sum(1 for assoc in self.associations if assoc.get("abstract"))
+        logging.info(
+            f"Streaming pipeline finished in {time.time() - start_time:.2f} seconds: "
+            f"{len(self._seen_variants)} damaging variant tuples, {len(self.associations)} GWAS associations, "
+            f"{num_with_abstracts} with abstracts."
+        )
+        self.rag._update_progress("fetch_pubmed_abstracts", len(self.associations), len(self.associations), "completed")
+        return self.associations
+
+    async def _vep_stage(self, vcf_path: str, variant_queue: asyncio.Queue) -> None:
+        def on_progress(done_bytes: int, total_bytes: int) -> None:
+            self._counts["vep_done"] = done_bytes
+            self._counts["vep_total"] = total_bytes
+            self._report()
+
+        async for batch_result in self._annotation_batches(vcf_path, on_progress):
+            # Classify off the event loop so HTTP stages keep running
+            damaging = await asyncio.to_thread(self.rag.find_damaging_variants_info, batch_result)
+            for variant_tuple in damaging:
+                if variant_tuple in self._seen_variants:
+                    continue
+                self._seen_variants.add(variant_tuple)
+                self._counts["gwas_total"] += 1
+                await variant_queue.put(variant_tuple)
+        self._counts["vep_finished"] = True
+        self._report()
+
+    async def _annotation_batches(self, vcf_path: str, on_progress):
+        """Yield annotation batches from the file's own CSQ/ANN field if present, else from VEP."""
+        detected = await asyncio.to_thread(detect_consequence_field, vcf_path)
+        if detected is None:
+            async for batch_result in stream_vep_annotations(vcf_path, self.max_workers, on_progress=on_progress):
+                yield batch_result
+            return
+
+        key, field_names = detected
+        logging.info(f"Annotating {vcf_path} offline from its {key} INFO field")
+        reader = VCFReader(vcf_path)
+        batches = iter_local_annotation_batches(reader, key, field_names)
+        try:
+            while True:
+                # Parse off the event loop so HTTP stages keep running
+                batch_result = await asyncio.to_thread(next, batches, None)
+                if batch_result is None:
+                    return
+                on_progress(reader.bytes_read, reader.size)
+                yield batch_result
+        finally:
+            reader.close()
+
+    async def _gwas_stage(self, variant_queue: asyncio.Queue, pmid_queue: asyncio.Queue) -> None:
+        while True:
+            variant_tuple = await variant_queue.get()
+            if variant_tuple is _DONE:
+                return
+            try:
+                associations = await self.rag._fetch_gwas_associations_for_rsid(variant_tuple)
+            except Exception as exc:
+                logging.error(f"Error during GWAS fetch for variant {variant_tuple}: {exc}")
+                associations = []
+            self._counts["gwas_done"] += 1
+            self._report()
+            for assoc in associations:
+                self.associations.append(assoc)
+                pmid = assoc.get("pubmedId")
+                if not pmid or pmid == "N/A" or str(pmid) in self._seen_pmids:
+                    continue
+                self._seen_pmids.add(str(pmid))
+                self._counts["pubmed_total"] += 1
+                await pmid_queue.put(str(pmid))
+
+    async def _pubmed_stage(self, pmid_queue: asyncio.Queue) -> None:
+        """
+        Group incoming PMIDs into efetch batches and resolve them with bounded concurrency.
+        A slot is taken before the next batch is drained, so the PMID queue fills up (and
+        the GWAS stage waits) while all slots are busy.
+        """
+        slots = asyncio.Semaphore(PUBMED_STAGE_WORKERS)
+        fetches = set()
+
+        async def resolve(batch: List[str]) -> None:
+            try:
+                self.abstracts.update(await self.rag.resolve_abstracts(batch))
+            except Exception as exc:
+                logging.error(f"Error resolving abstracts for {len(batch)} PubMed IDs: {exc}")
+            finally:
+                slots.release()
+            self._counts["pubmed_done"] += len(batch)
+            self._report()
+
+        finished = False
+        while not finished:
+            await slots.acquire()
+            batch: List[str] = []
+            item = await pmid_queue.get()
+            if item is _DONE:
+                slots.release()
+                break
+            batch.append(item)
+            deadline = time.monotonic() + PMID_BATCH_LINGER
+            while len(batch) < PUBMED_EFETCH_BATCH_SIZE:
+                if pmid_queue.empty():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(pmid_queue.get(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    item = pmid_queue.get_nowait()
+                if item is _DONE:
+                    finished = True
+                    break
+                batch.append(item)
+            task = asyncio.create_task(resolve(batch))
+            fetches.add(task)
+            task.add_done_callback(fetches.discard)
+        if fetches:
+            await asyncio.gather(*fetches)
+
+    def _report(self) -> None:
+        """Report progress for the earliest stage that is still running."""
+        c = self._counts
+        if not c["vep_finished"]:
+            self.rag._update_progress("vep_annotation", c["vep_done"], c["vep_total"], "in_progress")
+        elif not c["gwas_finished"]:
+            self.rag._update_progress("fetch_gwas_associations", c["gwas_done"], c["gwas_total"], "in_progress")
+        else:
+            self.rag._update_progress("fetch_pubmed_abstracts", c["pubmed_done"], c["pubmed_total"], "in_progress")
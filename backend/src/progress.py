@@ -0,0 +1,101 @@
+"""
+Progress module providing an in-memory progress bus: pipeline stages publish their latest
+progress record per topic (an analysis job ID), and subscribers are woken at most once per
+PUSH_INTERVAL with the newest state, however many updates were published in between.
+"""
+import asyncio
+import os
+import threading
+from typing import Any, AsyncIterator, Dict, List, Optional
+from singleton import process_wide
+
+# Topic used by runs that are not server jobs (CLI, scripts)
+DEFAULT_TOPIC = "default"
+# Minimum seconds between pushes to one subscriber; updates in between are coalesced
+PUSH_INTERVAL = float(os.getenv("PROGRESS_PUSH_INTERVAL", "0.25"))
+
+class _Subscriber:
+    def __init__(self, loop: asyncio.AbstractEventLoop) -> None:
+        self.loop = loop
+        self.wake = asyncio.Event()
+        self.notified = False
+
+class ProgressBus:
+    """
+    Thread-safe store of the latest progress record per topic. Publishing only replaces a
+    dict and bumps a version under a lock, so it is cheap enough for the hot loops of
+    the pipeline; subscribers on any event loop are woken with call_soon_threadsafe.
+    """
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._latest: Dict[str, Dict[str, Any]] = {}
+        self._versions: Dict[str, int] = {}
+        self._subscribers: Dict[str, List[_Subscriber]] = {}
+
+    def publish(self, topic: str, record: Dict[str, Any]) -> None:
+        """Replace the topic's latest progress record and wake its subscribers."""
+        with self._lock:
+            self._latest[topic] = record
+            self._bump(topic)
+
+    def notify(self, topic: str) -> None:
+        """Wake the topic's subscribers without changing its record (e.g. a job status change)."""
+        with self._lock:
+            self._bump(topic)
+
+    def latest(self, topic: str) -> Optional[Dict[str, Any]]:
+        """Return the topic's latest progress record, or None if nothing was published."""
+        with self._lock:
+            return self._latest.get(topic)
+
+    def version(self, topic: str) -> int:
+        with self._lock:
+            return self._versions.get(topic, 0)
+
+    def discard(self, topic: str) -> None:
+        """Forget a topic's record, e.g. when its job is evicted."""
+        with self._lock:
+            self._latest.pop(topic, None)
+            self._versions.pop(topic, None)
+
+    def _bump(self, topic: str) -> None:
+        self._versions[topic] = self._versions.get(topic, 0) + 1
+        for subscriber in self._subscribers.get(topic, ()):
+            # One wake-up per subscriber until it has caught up
+            if not subscriber.notified:
+                subscriber.notified = True
+                subscriber.loop.call_soon_threadsafe(subscriber.wake.set)
+
+    async def subscribe(self, topic: str, interval: float = PUSH_INTERVAL) -> AsyncIterator[int]:
+        """
+        Async iterator yielding the topic's version immediately and then whenever it has
+        changed, at most once per interval. Callers read the state they need on each step.
+        """
+        subscriber = _Subscriber(asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers.setdefault(topic, []).append(subscriber)
+        try:
+            last_version = None
+            while True:
+                current = self.version(topic)
+                if current != last_version:
+                    last_version = current
+                    yield current
+                    await asyncio.sleep(interval)
+                    continue
+                await subscriber.wake.wait()
+                with self._lock:
+                    subscriber.wake.clear()
+                    subscriber.notified = False
+        finally:
+            with self._lock:
+                subscribers = self._subscribers.get(topic, [])
+                if subscriber in subscribers:
+                    subscribers.remove(subscriber)
+                if not subscribers:
+                    self._subscribers.pop(topic, None)
+
+@process_wide
+def get_progress_bus() -> ProgressBus:
+    """Return the process-wide progress bus."""
+    return ProgressBus()
@@ -1,21 +1,59 @@
+import asyncio
 import json
-import requests
+import os
+import httpx
 import logging
-from bs4 import BeautifulSoup
+import xml.etree.ElementTree as ET
 from collections import defaultdict
-from typing import Tuple, Dict, Any, List, Optional
-import re
+from typing import Tuple, Dict, Any, List, Optional, Iterable
 import time
 from tqdm import tqdm
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import random # For random jitter in sleep
+from concurrent.futures import as_completed
 from models import parse_trait_summary
+from cache import KVCache
+from gwas_index import get_gwas_index
+from http_engine import get_engine
+from progress import DEFAULT_TOPIC, get_progress_bus
+from singleflight import SingleFlight
+from singleton import process_wide
 
 # --- Configuration ---
 NCBI_EMAIL = "kbkyeofzdwcccsjzzy@nespj.com"  # Replace with your real email for NCBI API
-# Adjusted to align with original script's likely parallelism for GWAS calls
-MAX_WORKERS_GWAS = 20
-MAX_WORKERS_PUBMED = 15 # This seemed consistent with original intent
+# Request concurrency per host (GWAS Catalog, E-utilities) is set in http_engine.HOST_CONCURRENCY
+# E-utilities base URL; point this at a local stand-in (see eutils_stub.py) for testing
+EUTILS_BASE = os.getenv("EUTILS_BASE", "https://eutils.ncbi.nlm.nih.gov/entrez/eutils")
+NCBI_API_KEY = os.getenv("NCBI_API_KEY")
+# PMIDs per efetch request; NCBI recommends POST for more than ~200 IDs
+PUBMED_EFETCH_BATCH_SIZE = 200
+# Raw GWAS association payloads (including empty ones) are reused for this long
+GWAS_CACHE_TTL_DAYS = float(os.getenv("GWAS_CACHE_TTL_DAYS", "30"))
+# PMIDs whose article has no abstract are not requested again for this long
+ABSTRACT_MISS_TTL_HOURS = float(os.getenv("ABSTRACT_MISS_TTL_HOURS", "72"))
+
+# PolyPhen predictions that make a MODERATE-impact consequence damaging
+DAMAGING_POLYPHEN = ["probably_damaging", "possibly_damaging"]
+
+# In-flight GWAS and PubMed lookups, shared by every RAG instance (job) in the process
+_gwas_flights = SingleFlight("gwas_associations")
+_abstract_flights = SingleFlight("pubmed_abstracts")
+
+@process_wide
+def get_gwas_cache() -> KVCache:
+    """Return the process-wide cache of raw GWAS association payloads, opening it on first use."""
+    return KVCache("gwas_associations", ttl=GWAS_CACHE_TTL_DAYS * 86400)
+
+@process_wide
+def get_abstract_store() -> KVCache:
+    """Return the process-wide PubMed abstract store, opening it on first use."""
+    return KVCache("pubmed_abstracts")
+
+@process_wide
+def get_abstract_misses() -> KVCache:
+    """
+    Return the process-wide negative cache of PMIDs whose article has no abstract, opening
+    it on first use. Kept apart from the abstract store, whose readers only see abstracts.
+    """
+    return KVCache("pubmed_abstract_misses", ttl=ABSTRACT_MISS_TTL_HOURS * 3600)
 
 # File paths
 VEP_ANNOTATION_FILE = "generated_annotation/annotation.json"
@@ -26,104 +64,147 @@ class RAG:
     RAG class for identifying damaging variants from VEP output, searching GWAS catalog
     associations for these variants, and fetching corresponding PubMed abstracts.
     """
-    def __init__(self) -> None:
-        self.session = requests.Session()
-        self.session.headers.update({'User-Agent': f'Python RAG Module ({NCBI_EMAIL})'})
+    def __init__(self, progress_topic: str = DEFAULT_TOPIC, resolve_images: bool = True) -> None:
+        """
+        Args:
+            progress_topic (str): Progress bus topic for this run; concurrent runs
+                (e.g. server jobs) each publish under their own job ID.
+            resolve_images (bool): Search for uncached trait images before returning
+                results. Server jobs pass False and resolve images after completing.
+        """
+        self.progress_topic = progress_topic
+        self.resolve_images = resolve_images
+        # Associations (with abstracts) behind the last summarised results, kept for chat
+        self.associations: List[Dict[str, Any]] = []
+        self.headers = {'User-Agent': f'Python RAG Module ({NCBI_EMAIL})'}
         self.processed_pmids = set()
+        # Caches are shared by every RAG instance (job) in the process, and across processes on this host
+        self.gwas_cache = get_gwas_cache()
+        # Local GWAS Catalog index (see gwas_index.py); when built, it replaces the REST lookups
+        self.gwas_index = get_gwas_index()
+        self.abstract_store = get_abstract_store()
+        self.abstract_misses = get_abstract_misses()
+
+    async def _fetch_gwas_payload(self, rsid: str) -> Optional[List[Dict[str, Any]]]:
+        """
+        Return the raw GWAS associations for an rsID, from the local catalog index if one
+        has been built, otherwise from the cache or the REST API.
+        Empty results and 404s are cached too, so they are not re-requested within the TTL.
+        Returns None on transient failures, which are not cached. Concurrent lookups of the
+        same rsID (another gene or allele of the same variant, or another job) share one
+        cache read and request; allele filtering is applied to the shared payload afterwards.
+        """
+        if self.gwas_index is not None:
+            return self.gwas_index.lookup(rsid)
+        return await _gwas_flights.do(rsid, lambda: self._load_gwas_payload(rsid))
+
+    async def _load_gwas_payload(self, rsid: str) -> Optional[List[Dict[str, Any]]]:
+        cached = await asyncio.to_thread(self.gwas_cache.get, rsid)
+        if cached is not None:
+            return cached
 
-    def _fetch_gwas_associations_for_rsid(self, variant_details: Tuple[str, str, str]) -> List[Dict[str, Any]]:
-        extracted_associations = []
+        assoc_url = f"https://www.ebi.ac.uk/gwas/api/v2/variants/{rsid}/associations?size=30&page=0&sort=pValue,asc"
+        try:
+            response = await get_engine().request("GET", assoc_url, headers=self.headers, timeout=20)
+            if response.status_code == 404:
+                await asyncio.to_thread(self.gwas_cache.put, rsid, [])
+                return []
+            response.raise_for_status()
+            data = response.json()
+        except httpx.HTTPError as e:
+            logging.warning(f"Request failed for GWAS associations for rsID {rsid}: {e}")
+            return None
+        except json.JSONDecodeError:
+            logging.warning(f"JSON decode failed for GWAS associations for rsID {rsid}. Response: {response.text[:200]}...")
+            return None
+
+        associations = data.get("_embedded", {}).get("associations", [])
+        await asyncio.to_thread(self.gwas_cache.put, rsid, associations)
+        return associations
+
+    async def _fetch_gwas_associations_for_rsid(self, variant_details: Tuple[str, str, str]) -> List[Dict[str, Any]]:
         gene_symbol, rsid, vep_risk_allele = variant_details
         
         if not vep_risk_allele:
             logging.debug(f"Skipping rsID {rsid} for gene {gene_symbol} due to missing VEP risk allele.")
             return []
 
-        assoc_url = f"https://www.ebi.ac.uk/gwas/api/v2/variants/{rsid}/associations?size=30&page=0&sort=pValue,asc"
-        
-        try:
-            # Adjusted sleep to align with original script's likely delay
-            time.sleep(random.uniform(0.1, 0.3))
-            response = self.session.get(assoc_url, timeout=20)
-            response.raise_for_status()
-            data = response.json()
-            associations = data.get("_embedded", {}).get("associations", [])
+        associations = await self._fetch_gwas_payload(rsid)
+        if not associations:
+            return []
+        return self._extract_gwas_associations(associations, variant_details)
 
-            for assoc in associations:
-                trait_info_list = assoc.get("traitName", [])
-                trait_name = trait_info_list[0] if trait_info_list else "N/A"
-                
-                beta_object = assoc.get("beta")
-                beta_value = "N/A"
-                if isinstance(beta_object, dict):
-                    beta_value = beta_object.get("betaValue", "N/A")
-                elif isinstance(beta_object, (int, float)):
-                    beta_value = beta_object
-
-                pubmed_id = assoc.get("pubmedId", "N/A")
-                
-                api_reported_alleles = assoc.get("riskAllele", [])
-                is_correct_risk_allele_for_assoc = False
-                matched_api_allele_representation = "N/A"
+    def _extract_gwas_associations(self, associations: List[Dict[str, Any]], variant_details: Tuple[str, str, str]) -> List[Dict[str, Any]]:
+        """Keep the associations whose risk allele matches the VEP allele, in the RAG record shape."""
+        extracted_associations = []
+        gene_symbol, rsid, vep_risk_allele = variant_details
 
-                if not api_reported_alleles:
-                    logging.debug(f"No risk allele info in GWAS association for rsID {rsid}, trait '{trait_name}'. Skipping entry.")
-                    continue
+        for assoc in associations:
+            trait_info_list = assoc.get("traitName", [])
+            trait_name = trait_info_list[0] if trait_info_list else "N/A"
+            
+            beta_object = assoc.get("beta")
+            beta_value = "N/A"
+            if isinstance(beta_object, dict):
+                beta_value = beta_object.get("betaValue", "N/A")
+            elif isinstance(beta_object, (int, float)):
+                beta_value = beta_object
+
+            pubmed_id = assoc.get("pubmedId", "N/A")
+            
+            api_reported_alleles = assoc.get("riskAllele", [])
+            is_correct_risk_allele_for_assoc = False
+            matched_api_allele_representation = "N/A"
 
-                for ra_obj in api_reported_alleles:
-                    allele_char_from_key = ra_obj.get("key") 
-                    allele_char_from_label = None
-                    label_val = ra_obj.get("label")
-
-                    if label_val:
-                        if '-' in label_val:
-                            allele_char_from_label = label_val.split('-')[-1]
-                        else:
-                            allele_char_from_label = label_val
-                    
-                    if allele_char_from_key == vep_risk_allele:
-                        is_correct_risk_allele_for_assoc = True
-                        matched_api_allele_representation = label_val or allele_char_from_key
-                        break
-                    if allele_char_from_label == vep_risk_allele:
-                        is_correct_risk_allele_for_assoc = True
-                        matched_api_allele_representation = label_val
-                        break
-                
-                if not is_correct_risk_allele_for_assoc:
-                    continue
+            if not api_reported_alleles:
+                logging.debug(f"No risk allele info in GWAS association for rsID {rsid}, trait '{trait_name}'. Skipping entry.")
+                continue
 
-                p_value_exponent = assoc.get("pValueExponent")
-                p_value_mantissa = assoc.get("pValue")
-                calculated_p_value = (
-                    f"{p_value_mantissa}e{p_value_exponent}" if p_value_exponent is not None and p_value_mantissa is not None else "N/A"
-                )
+            for ra_obj in api_reported_alleles:
+                allele_char_from_key = ra_obj.get("key") 
+                allele_char_from_label = None
+                label_val = ra_obj.get("label")
+
+                if label_val:
+                    if '-' in label_val:
+                        allele_char_from_label = label_val.split('-')[-1]
+                    else:
+                        allele_char_from_label = label_val
                 
-                odds_ratio = assoc.get("orValue")
-                if odds_ratio is None:
-                    odds_ratio = assoc.get("oddsRatio", "N/A")
-
-                if odds_ratio != "N/A" or (isinstance(beta_value, (int, float))):
-                    extracted_associations.append({
-                        "traitName": trait_name,
-                        "beta": beta_value,
-                        "pubmedId": pubmed_id,
-                        "riskAllele_GWAS": matched_api_allele_representation,
-                        "pValue": calculated_p_value,
-                        "OR": odds_ratio,
-                        "gene_symbol_from_vep": gene_symbol,
-                        "rsid_from_vep": rsid,
-                        "risk_allele_from_vep": vep_risk_allele
-                    })
+                if allele_char_from_key == vep_risk_allele:
+                    is_correct_risk_allele_for_assoc = True
+                    matched_api_allele_representation = label_val or allele_char_from_key
+                    break
+                if allele_char_from_label == vep_risk_allele:
+                    is_correct_risk_allele_for_assoc = True
+                    matched_api_allele_representation = label_val
+                    break
             
-        except requests.exceptions.RequestException as e:
-            logging.warning(f"Request failed for GWAS associations for rsID {rsid} (Gene: {gene_symbol}): {e}")
-        except json.JSONDecodeError:
-            # It's good to see the response text if JSON decoding fails
-            response_text = "N/A"
-            if 'response' in locals() and hasattr(response, 'text'):
-                response_text = response.text[:200]
-            logging.warning(f"JSON decode failed for GWAS associations for rsID {rsid} (Gene: {gene_symbol}). Response: {response_text}...")
+            if not is_correct_risk_allele_for_assoc:
+                continue
+
+            p_value_exponent = assoc.get("pValueExponent")
+            p_value_mantissa = assoc.get("pValue")
+            calculated_p_value = (
+                f"{p_value_mantissa}e{p_value_exponent}" if p_value_exponent is not None and p_value_mantissa is not None else "N/A"
+            )
+            
+            odds_ratio = assoc.get("orValue")
+            if odds_ratio is None:
+                odds_ratio = assoc.get("oddsRatio", "N/A")
+
+            if odds_ratio != "N/A" or (isinstance(beta_value, (int, float))):
+                extracted_associations.append({
+                    "traitName": trait_name,
+                    "beta": beta_value,
+                    "pubmedId": pubmed_id,
+                    "riskAllele_GWAS": matched_api_allele_representation,
+                    "pValue": calculated_p_value,
+                    "OR": odds_ratio,
+                    "gene_symbol_from_vep": gene_symbol,
+                    "rsid_from_vep": rsid,
+                    "risk_allele_from_vep": vep_risk_allele
+                })
         return extracted_associations
 
     def find_damaging_variants_info(self, variants_data: List[Dict[str, Any]]) -> List[Tuple[str, str, str]]:
@@ -168,8 +249,7 @@ class RAG:
                 if impact == "HIGH":
                     is_damaging_transcript = True
                 elif impact == "MODERATE":
-                    if sift_pred == "deleterious" or \
-                       polyphen_pred in ["probably_damaging", "possibly_damaging"]:
+                    if sift_pred == "deleterious" or polyphen_pred in DAMAGING_POLYPHEN:
                         is_damaging_transcript = True
                 
                 if is_damaging_transcript:
@@ -177,44 +257,68 @@ class RAG:
         
         return sorted(list(damaging_info))
 
-    def _fetch_abstract_from_pubmed_id(self, pubmed_id: str) -> Optional[str]:
-        if not pubmed_id or pubmed_id == 'N/A':
-            return None
-        try:
-            url = f"https://pubmed.ncbi.nlm.nih.gov/{pubmed_id}/"
-            # Adjusted sleep to align with original script's likely delay
-            time.sleep(random.uniform(0.1, 0.4))
+    async def _fetch_abstracts_from_pubmed_ids(self, pubmed_ids: List[str]) -> Dict[str, Optional[str]]:
+        """
+        Fetch abstracts for a list of PMIDs with a single E-utilities efetch request.
+        The XML response is parsed incrementally as it streams in, one article at a time.
+        Returns a mapping of PMID to abstract text (None when the article has no abstract).
+        """
+        payload = {
+            "db": "pubmed",
+            "id": ",".join(pubmed_ids),
+            "retmode": "xml",
+            "rettype": "abstract",
+            "tool": "variantexplain",
+            "email": NCBI_EMAIL,
+        }
+        if NCBI_API_KEY:
+            payload["api_key"] = NCBI_API_KEY
 
-            response = self.session.get(url, timeout=15)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            abstract_div = soup.find('div', {'class': 'abstract-content selected'})
-            if not abstract_div:
-                abstract_div = soup.find('div', id='abstract') 
-            if not abstract_div:
-                 abstract_div = soup.find('div', class_=re.compile(r'\babstract\b', re.I))
-
-            if abstract_div:
-                text_parts = [p.get_text(strip=True) for p in abstract_div.find_all(['p', 'strong'])]
+        abstracts: Dict[str, Optional[str]] = {}
+        try:
+            response = await get_engine().request(
+                "POST", f"{EUTILS_BASE}/efetch.fcgi", data=payload, headers=self.headers, timeout=60, stream=True
+            )
+            try:
+                response.raise_for_status()
+                parser = ET.XMLPullParser(events=("end",))
+                async for chunk in response.aiter_bytes():
+                    parser.feed(chunk)
+                    self._collect_parsed_abstracts(parser.read_events(), abstracts)
+                parser.close()
+                self._collect_parsed_abstracts(parser.read_events(), abstracts)
+            finally:
+                await response.aclose()
+        except httpx.HTTPError as e:
+            logging.warning(f"efetch request failed for {len(pubmed_ids)} PubMed IDs: {e}")
+        except ET.ParseError as e:
+            logging.warning(f"Malformed efetch response for {len(pubmed_ids)} PubMed IDs: {e}")
+        return abstracts
+
+    @staticmethod
+    def _collect_parsed_abstracts(events: Iterable[Tuple[str, ET.Element]], abstracts: Dict[str, Optional[str]]) -> None:
+        """Extract PMID and abstract from each completed article element, then free it."""
+        for _, elem in events:
+            if elem.tag not in ("PubmedArticle", "PubmedBookArticle"):
+                continue
+            pmid = elem.findtext("MedlineCitation/PMID") or elem.findtext("BookDocument/PMID")
+            if pmid:
+                text_parts = []
+                for abstract_text in elem.iterfind(".//Abstract/AbstractText"):
+                    label = abstract_text.get("Label")
+                    if label:
+                        text_parts.append(label)
+                    text_parts.append("".join(abstract_text.itertext()).strip())
                 full_abstract = "\n".join(filter(None, text_parts))
-                return full_abstract if full_abstract else None
-            else:
-                logging.debug(f"No abstract content found for PubMed ID {pubmed_id} using common selectors.")
-                return None
-        except requests.exceptions.RequestException as e:
-            logging.warning(f"Request failed for PubMed ID {pubmed_id}: {e}")
-            return None
-        except Exception as e:
-            logging.warning(f"Unexpected error fetching abstract for PubMed ID {pubmed_id}: {e}")
-            return None
+                abstracts[pmid.strip()] = full_abstract or None
+            elem.clear()
 
     def append_pubmed_abstracts(self, gwas_associations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         pmids_to_fetch_map = defaultdict(list)
         for assoc_item in gwas_associations:
             pmid = assoc_item.get('pubmedId')
-            if pmid and pmid != 'N/A' and pmid not in self.processed_pmids:
-                pmids_to_fetch_map[pmid].append(assoc_item)
+            if pmid and pmid != 'N/A' and str(pmid) not in self.processed_pmids:
+                pmids_to_fetch_map[str(pmid)].append(assoc_item)
             # Ensure 'abstract' key exists even if pmid is invalid/processed or already fetched
             if 'abstract' not in assoc_item: 
                  assoc_item['abstract'] = None # Default to None
@@ -223,59 +327,87 @@ class RAG:
             logging.info("No new unique PubMed IDs to fetch abstracts for in this batch.")
             return gwas_associations
 
+        stored_abstracts = self.abstract_store.get_many(pmids_to_fetch_map.keys())
+        for pmid, abstract in stored_abstracts.items():
+            self.processed_pmids.add(pmid)
+            for assoc_item_ref in pmids_to_fetch_map.pop(pmid):
+                assoc_item_ref["abstract"] = abstract
+        logging.info(f"Found {len(stored_abstracts)} abstracts in the local store.")
+
+        if not pmids_to_fetch_map:
+            return gwas_associations
+
         unique_pmids_list = list(pmids_to_fetch_map.keys())
-        logging.info(f"Fetching abstracts for {len(unique_pmids_list)} new unique PubMed IDs.")
-        
-        with ThreadPoolExecutor(max_workers=MAX_WORKERS_PUBMED) as executor:
-            future_to_pmid = {
-                executor.submit(self._fetch_abstract_from_pubmed_id, pmid): pmid
-                for pmid in unique_pmids_list
-            }
-            
-            # Initialize thread-safe counter for completed fetches
-            from threading import Lock
-            completed_count = 0
-            counter_lock = Lock()
-            total_pmids = len(unique_pmids_list)
-
-            def update_progress():
-                nonlocal completed_count
-                with counter_lock:
-                    completed_count += 1
-                    progress = int((completed_count / total_pmids) * 100)
-                    self._update_progress("fetch_pubmed_abstracts", progress, 100, "in_progress")
-
-            for future in tqdm(as_completed(future_to_pmid), total=total_pmids, desc="Fetching PubMed abstracts"):
-                pmid = future_to_pmid[future]
-                update_progress()
-                try:
-                    abstract = future.result()
-                    self.processed_pmids.add(pmid) # Mark as processed (even if abstract is None)
-                    for assoc_item_ref in pmids_to_fetch_map[pmid]:
-                        assoc_item_ref["abstract"] = abstract
-                except Exception as exc:
-                    logging.error(f"Error processing abstract future for PMID {pmid}: {exc}")
-                    for assoc_item_ref in pmids_to_fetch_map[pmid]: # Ensure abstract is None on error
-                        assoc_item_ref["abstract"] = None
-        
+        pmid_batches = [
+            unique_pmids_list[i : i + PUBMED_EFETCH_BATCH_SIZE]
+            for i in range(0, len(unique_pmids_list), PUBMED_EFETCH_BATCH_SIZE)
+        ]
+        logging.info(f"Fetching abstracts for {len(unique_pmids_list)} new unique PubMed IDs in {len(pmid_batches)} efetch requests.")
+        completed_count = 0
+        total_pmids = len(unique_pmids_list)
+
+        # Requests run on the shared HTTP engine, bounded by its per-host concurrency limit;
+        # PMIDs another job is already fetching are shared rather than requested again
+        engine = get_engine()
+        future_to_batch = {
+            engine.submit(self.resolve_abstracts(batch)): batch
+            for batch in pmid_batches
+        }
+
+        for future in tqdm(as_completed(future_to_batch), total=len(pmid_batches), desc="Fetching PubMed abstracts"):
+            batch = future_to_batch[future]
+            completed_count += len(batch)
+            self._update_progress("fetch_pubmed_abstracts", int(100 * completed_count / total_pmids), 100, "in_progress")
+            try:
+                # Found abstracts are stored by resolve_abstracts; resolved PMIDs are marked processed
+                batch_abstracts = future.result()
+            except Exception as exc:
+                logging.error(f"Error processing efetch future for {len(batch)} PubMed IDs: {exc}")
+                batch_abstracts = {}
+            for pmid in batch:
+                abstract = batch_abstracts.get(pmid)
+                for assoc_item_ref in pmids_to_fetch_map[pmid]:
+                    assoc_item_ref["abstract"] = abstract
         return gwas_associations
 
+    async def resolve_abstracts(self, pubmed_ids: List[str]) -> Dict[str, Optional[str]]:
+        """
+        Return abstracts for the given PMIDs from the shared store, fetching only the misses.
+        PMIDs that are already being resolved, by this or another job, join that lookup
+        instead of being requested again.
+        """
+        abstracts = await _abstract_flights.do_many(pubmed_ids, self._load_abstracts)
+        self.processed_pmids.update(abstracts)
+        return abstracts
+
+    async def _load_abstracts(self, pubmed_ids: List[str]) -> Dict[str, Optional[str]]:
+        stored: Dict[str, Optional[str]] = await asyncio.to_thread(self.abstract_store.get_many, pubmed_ids)
+        unstored = [pmid for pmid in pubmed_ids if pmid not in stored]
+        if unstored:
+            known_missing = await asyncio.to_thread(self.abstract_misses.get_many, unstored)
+            stored.update(dict.fromkeys(known_missing))
+        misses = [pmid for pmid in pubmed_ids if pmid not in stored]
+        fetched = await self._fetch_abstracts_from_pubmed_ids(misses) if misses else {}
+        # Articles returned without an abstract go to the negative cache, which expires sooner;
+        # PMIDs missing from the response (failed requests) are retried next time
+        new_abstracts = {pmid: abstract for pmid, abstract in fetched.items() if abstract}
+        new_misses = {pmid: time.time() for pmid, abstract in fetched.items() if not abstract}
+        if new_abstracts:
+            await asyncio.to_thread(self.abstract_store.put_many, new_abstracts)
+        if new_misses:
+            await asyncio.to_thread(self.abstract_misses.put_many, new_misses)
+        return {**stored, **fetched}
+
     def _update_progress(self, step: str, current: int, total: int, status: str = "in_progress") -> None:
-        """Update the progress file with the current step's progress."""
-        progress = {
+        """Publish the current step's progress to the in-memory progress bus."""
+        get_progress_bus().publish(self.progress_topic, {
             "step": step,
             "current": current,
             "total": total,
             "percentage": round(100 * current / total, 1) if total > 0 else 0,
             "status": status,
             "timestamp": time.time()
-        }
-        progress_file = "generated_annotation/rag_progress.json"
-        try:
-            with open(progress_file, "w") as pf:
-                json.dump(progress, pf)
-        except Exception as e:
-            logging.error(f"Failed to write progress file: {e}")
+        })
 
     def process_vep_data(self, vep_data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         logging.info("Initiating VEP data processing workflow...")
@@ -300,29 +432,29 @@ class RAG:
         logging.info(f"Sample damaging variants (first 3 if available): {damaging_variant_tuples[:3]}")
 
         # Process GWAS associations
-        logging.info(f"Fetching GWAS associations using up to {MAX_WORKERS_GWAS} workers...")
+        logging.info("Fetching GWAS associations through the shared HTTP engine...")
         all_gwas_associations = []
         completed_variants = 0
         
         # Update status to fetch_gwas_associations
         self._update_progress("fetch_gwas_associations", 0, num_variants, "in_progress")
         
-        with ThreadPoolExecutor(max_workers=MAX_WORKERS_GWAS) as executor:
-            future_to_variant_tuple = {
-                executor.submit(self._fetch_gwas_associations_for_rsid, vt): vt 
-                for vt in damaging_variant_tuples
-            }
-            for future in tqdm(as_completed(future_to_variant_tuple), total=len(damaging_variant_tuples), desc="Fetching GWAS associations"):
-                variant_tuple_key = future_to_variant_tuple[future]
-                completed_variants += 1
-                self._update_progress("fetch_gwas_associations", completed_variants, num_variants, "in_progress")
-                
-                try:
-                    associations_for_variant = future.result()
-                    if associations_for_variant:
-                        all_gwas_associations.extend(associations_for_variant)
-                except Exception as exc:
-                    logging.error(f"Error processing future for variant {variant_tuple_key} during GWAS fetch: {exc}")
+        engine = get_engine()
+        future_to_variant_tuple = {
+            engine.submit(self._fetch_gwas_associations_for_rsid(vt)): vt
+            for vt in damaging_variant_tuples
+        }
+        for future in tqdm(as_completed(future_to_variant_tuple), total=len(damaging_variant_tuples), desc="Fetching GWAS associations"):
+            variant_tuple_key = future_to_variant_tuple[future]
+            completed_variants += 1
+            self._update_progress("fetch_gwas_associations", completed_variants, num_variants, "in_progress")
+            
+            try:
+                associations_for_variant = future.result()
+                if associations_for_variant:
+                    all_gwas_associations.extend(associations_for_variant)
+            except Exception as exc:
+                logging.error(f"Error processing future for variant {variant_tuple_key} during GWAS fetch: {exc}")
         
         logging.info(f"Fetched a total of {len(all_gwas_associations)} GWAS associations.")
         self._update_progress("fetch_gwas_associations", completed_variants, num_variants, "completed")
@@ -335,7 +467,7 @@ class RAG:
         logging.info(f"Sample GWAS associations (first 1 if available): {all_gwas_associations[:1]}")
 
         # Process PubMed abstracts
-        logging.info(f"Appending PubMed abstracts using up to {MAX_WORKERS_PUBMED} workers...")
+        logging.info("Appending PubMed abstracts...")
         
         if all_gwas_associations:
             # Update status to fetch_pubmed_abstracts
@@ -351,12 +483,32 @@ class RAG:
             logging.info("No GWAS associations to process PubMed abstracts for.")
             results_with_abstracts = []
             self._update_progress("fetch_pubmed_abstracts", 0, 0, "completed")
+        return self.summarise_associations(results_with_abstracts)
+
+    def process_vcf_file(self, vcf_path: str, max_workers: int = 30) -> List[Dict[str, Any]]:
+        """
+        Run the whole workflow for a VCF file as a streaming stage graph: each VEP batch is
+        filtered for damaging variants as it arrives, and GWAS and PubMed lookups start while
+        annotation is still running (see pipeline.StreamingPipeline). Then summarise the results.
+        """
+        from pipeline import StreamingPipeline
+        logging.info(f"Starting streaming pipeline for {vcf_path}...")
+        results_with_abstracts = get_engine().run(StreamingPipeline(self, max_workers).run(vcf_path))
+        if not results_with_abstracts:
+            logging.info("No relevant GWAS associations found for the damaging variants. Terminating process.")
+            self._update_progress("completed", 1, 1, "completed")
+            return []
+        return self.summarise_associations(results_with_abstracts)
+
+    def summarise_associations(self, results_with_abstracts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Summarise associations (with abstracts) into TraitSummary models and mark the run completed."""
+        self.associations = results_with_abstracts
         # --- Summarise Traits and Fetch Images ---
         from agent import Agent
         agent = Agent()
         self._update_progress("summarise_traits", 0, 1, "in_progress")
         try:
-            trait_summaries = agent.summarise_traits(results_with_abstracts)
+            trait_summaries = agent.summarise_traits(results_with_abstracts, resolve_images=self.resolve_images)
             self._update_progress("summarise_traits", 1, 1, "completed")
 
             trait_summaries_as_models = [parse_trait_summary(ts) for ts in trait_summaries]
@@ -0,0 +1,81 @@
+"""
+Result cache module: finished TraitSummary result sets, with the associations they were
+summarised from, stored under the input's content hash plus a fingerprint of the pipeline
+configuration, with size-bounded LRU eviction.
+"""
+import os
+import json
+import hashlib
+from typing import Any, Dict, List, Optional, Tuple
+from cache import KVCache
+from singleton import process_wide
+from models import TraitSummary
+
+# Compressed bytes kept before least recently used result sets are evicted
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+# Bump when pipeline logic changes in a way the configuration below does not capture
+RESULT_CACHE_VERSION = 2
+
+def pipeline_fingerprint() -> str:
+    """
+    Hash the settings that determine an analysis' results: VEP request options, annotation
+    mode, damaging-variant rule, GWAS source, summarisation filter thresholds and model.
+    """
+    from vep import VEP_PARAMS
+    from csq import ANNOTATION_MODE
+    from rag import DAMAGING_POLYPHEN
+    from gwas_index import current_version
+    from agent import GEN_MODEL, SUMMARY_PROMPT_VERSION, SUMMARY_MAX_PVALUE, SUMMARY_MIN_OR_DISTANCE
+
+    config = {
+        "version": RESULT_CACHE_VERSION,
+        "vep_params": VEP_PARAMS,
+        "annotation_mode": ANNOTATION_MODE,
+        "damaging_polyphen": DAMAGING_POLYPHEN,
+        # A rebuilt local GWAS index changes associations, so its build is part of the key
+        "gwas_index": current_version(),
+        "summary_max_pvalue": SUMMARY_MAX_PVALUE,
+        "summary_min_or_distance": SUMMARY_MIN_OR_DISTANCE,
+        "gen_model": GEN_MODEL,
+        "summary_prompt_version": SUMMARY_PROMPT_VERSION,
+    }
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()[:16]
+
+class ResultCache:
+    """Completed analyses keyed by "<input sha256>:<pipeline fingerprint>"."""
+    def __init__(self, max_bytes: int = RESULT_CACHE_MAX_BYTES) -> None:
+        self._store = KVCache("analysis_results", max_bytes=max_bytes)
+
+    @staticmethod
+    def key(sha256: str) -> str:
+        return f"{sha256}:{pipeline_fingerprint()}"
+
+    def get(self, sha256: str) -> Optional[Tuple[List[TraitSummary], List[Dict[str, Any]]]]:
+        """
+        Return the cached results and associations for an input under the current
+        configuration, if any.
+        """
+        cached = self._store.get(self.key(sha256))
+        if cached is None:
+            return None
+        return [TraitSummary(**summary) for summary in cached["results"]], cached["associations"]
+
+    def put(self, sha256: str, results: List[TraitSummary], associations: List[Dict[str, Any]]) -> None:
+        """Store results with their associations; abstracts are left to the abstract store."""
+        self._store.put(self.key(sha256), {
+            "results": [summary.model_dump() for summary in results],
+            "associations": associations,
+        })
+
+    def invalidate(self, sha256: Optional[str] = None) -> int:
+        """
+        Drop cached results for one input (under any configuration), or all of them.
+        Returns:
+            int: Number of result sets removed.
+        """
+        return self._store.delete_prefix(f"{sha256}:" if sha256 else "")
+
+@process_wide
+def get_result_cache() -> ResultCache:
+    """Return the process-wide result cache, opening it on first use."""
+    return ResultCache()
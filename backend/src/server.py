@@ -1,33 +1,19 @@
-import json
-import os
+import asyncio
 import logging
-from fastapi import FastAPI, WebSocket, UploadFile, File
+from fastapi import FastAPI, WebSocket, UploadFile, File, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.websockets import WebSocketDisconnect
-from typing import Dict, Any, Literal, Optional, List
+from typing import Dict, Literal, Optional, List
 from pydantic import BaseModel
 from pathlib import Path
-import threading
-import traceback
-import logging
-from fastapi import FastAPI, WebSocket, File, UploadFile, HTTPException
-from fastapi.responses import JSONResponse
-import os
-from pathlib import Path
 from models import TraitSummary
+from jobs import Job, JobManager
+from progress import get_progress_bus
+from uploads import store_upload, upload_sha256
+from result_cache import get_result_cache
+from http_engine import get_engine
 
-import threading
-
-# status one of Literal["idle", "generating_vep", "fetching_risky_genes", "fetching_trait_info", "finding_associated_studies", "summarising_results"]
-
-state = {
-    "filename": None,
-    "status": "idle",
-    "result": None,
-    "error": None,
-    "analysis_running": False
-}
-state_lock = threading.Lock()
+jobs = JobManager()
 
 app = FastAPI(
     title="VariantExplain API",
@@ -35,9 +21,6 @@ app = FastAPI(
     version="0.1.0"
 )
 
-trait_results: List[TraitSummary] = []
-trait_results_lock = threading.Lock()
-
 # Define a custom filter class
 class OpenAPIFilter(logging.Filter):
     def filter(self, record: logging.LogRecord) -> bool:
@@ -77,6 +60,9 @@ class FileUploadRequest(BaseModel):
 
 class FileUploadResponse(BaseModel):
     filename: str
+    original_filename: Optional[str] = None
+    sha256: Optional[str] = None
+    size: Optional[int] = None
 
 # Create uploads directory if it doesn't exist
 UPLOAD_DIR = Path("uploads")
@@ -84,113 +70,45 @@ UPLOAD_DIR.mkdir(exist_ok=True, parents=True)
 
 @app.post("/upload_file")
 async def upload_file(file: UploadFile = File(...)) -> FileUploadResponse:
+    """
+    Store an uploaded .vcf or .vcf.gz under the SHA-256 of its content. The file is copied
+    in chunks on a worker thread, so memory stays constant whatever the upload size.
+    """
     try:
-        # Save the uploaded file
-        file_path = UPLOAD_DIR / file.filename
-        state["filename"] = file.filename
-        with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
-            
-        return FileUploadResponse(filename=file.filename)
+        stored_name, sha256, size = await asyncio.to_thread(store_upload, file.file, UPLOAD_DIR, file.filename or "")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to upload file: {str(e)}")
+    finally:
+        await file.close()
+    return FileUploadResponse(filename=stored_name, original_filename=file.filename, sha256=sha256, size=size)
 
 
 class AnalysisResponse(BaseModel):
     message: str
-
-def run_analysis_thread(filename):
-    from parse import VCFParser
-    from rag import RAG
-    import traceback
-    import time
-    import json
-    import os
-    
-    def update_state(status, result=None, error=None):
-        with state_lock:
-            state["status"] = status
-            if result is not None:
-                state["result"] = result
-            if error is not None:
-                state["error"] = error
-    
-    def get_progress():
-        progress_file = "generated_annotation/rag_progress.json"
-        if os.path.exists(progress_file):
-            try:
-                with open(progress_file, 'r') as f:
-                    return json.load(f)
-            except Exception as e:
-                logging.error(f"Error reading progress file: {e}")
-        return {}
-    
-    try:
-        # Initialize state
-        with state_lock:
-            state.update({
-                "status": "starting",
-                "result": None,
-                "error": None,
-                "analysis_running": True,
-                "start_time": time.time()
-            })
-        
-        # Parse VCF file
-        file_path = UPLOAD_DIR / filename
-        parser = VCFParser(str(file_path))
-        
-        # Initialize RAG
-        rag = RAG()
-        
-        # Process VEP data - this will update progress to vep_annotation
-        update_state("vep_annotation")
-        
-        # Process VEP data - this will update the progress file
-        results = rag.process_vep_data(parser.annotation)
-        with trait_results_lock:
-            trait_results.clear()
-            trait_results.extend(results)
-        print("results", results)
-        # Check if processing completed successfully
-        progress = get_progress()
-        if progress.get("status") == "completed" and progress.get("step") == "fetch_pubmed_abstracts":
-            update_state("completed", result=results)
-        else:
-            update_state("completed", result=results)  # Still mark as completed even if progress file is missing
-        
-    except Exception as e:
-        error_msg = f"Error: {e}\n{traceback.format_exc()}"
-        logging.error(error_msg)
-        update_state("error", error=error_msg)
-    finally:
-        with state_lock:
-            state["analysis_running"] = False
-            if state.get("status") != "error":
-                state["status"] = "completed"
-
-    return AnalysisResponse(message="Analysis started in different thread")
+    job_id: Optional[str] = None
+    cached: bool = False
 
 @app.get("/analysis")
-async def analysis() -> AnalysisResponse:
-    with state_lock:
-        if state.get("analysis_running", False):
-            return AnalysisResponse(message="Analysis already running")
-        filename = state.get("filename")
-        if not filename:
-            return AnalysisResponse(message="No file uploaded")
-        # Start thread
-        thread = threading.Thread(target=run_analysis_thread, args=(filename,), daemon=True)
-        thread.start()
-        state["status"] = "vep_annotation"
-        state["analysis_running"] = True
-    return AnalysisResponse(message="Analysis started")
-
-from typing import Optional
+async def analysis(filename: str) -> AnalysisResponse:
+    """
+    Queue an analysis of an uploaded file (the filename /upload_file returned) and return
+    its job ID, which the status, results and chat endpoints take.
+    """
+    file_path = UPLOAD_DIR / Path(filename).name
+    if not file_path.exists():
+        raise HTTPException(status_code=404, detail=f"Uploaded file not found: {filename}")
+    # Submitting checks the result cache, so keep the SQLite read off the event loop
+    job = await asyncio.to_thread(jobs.submit, filename, str(file_path), upload_sha256(file_path.name))
+    if job.cached:
+        return AnalysisResponse(message="Analysis completed from cache", job_id=job.job_id, cached=True)
+    return AnalysisResponse(message="Analysis started", job_id=job.job_id)
+
 class StatusPollResponse(BaseModel):
     status: Literal[
         "idle", 
+        "queued",
         "starting",
         "vep_annotation",
         "find_damaging_variants",
@@ -200,59 +118,152 @@ class StatusPollResponse(BaseModel):
         "completed",
         "error"
     ]
+    job_id: Optional[str] = None
     progress: Optional[float] = 0
     step: Optional[str] = None
     current: Optional[int] = 0
     total: Optional[int] = 0
     message: Optional[str] = None
+    # True after completion while trait images are still being resolved
+    images_pending: bool = False
+
+def job_status(job: Job) -> StatusPollResponse:
+    """Build a job's status from its state and its latest in-memory progress record."""
+    with job.lock:
+        current_status = job.status
+        error = job.error
+        images_pending = job.images_pending
+    response = StatusPollResponse(status=current_status, job_id=job.job_id, images_pending=images_pending)
+    if job.done:
+        response.message = error.splitlines()[0] if error else None
+        return response
+
+    progress_data = job.read_progress()
+    if progress_data:
+        # While running, report the pipeline step as the status
+        step = progress_data.get('step')
+        if progress_data.get('status') == 'in_progress' and step in StatusPollResponse.__annotations__['status'].__args__:
+            response.status = step
+        response.step = step
+        response.current = progress_data.get('current', 0)
+        response.total = progress_data.get('total', 1)
+        response.progress = progress_data.get('percentage', 0)
+        response.message = f"{response.step}: {response.progress}%"
+    return response
 
 @app.get("/status_poll")
-async def status_poll() -> StatusPollResponse:
-    """Polling endpoint for status updates."""
-    with state_lock:
-        current_status = state["status"]
-    
-    # Initialize response with current status
-    response = StatusPollResponse(status=current_status)
-    
-    # Try to read progress from rag_progress.json
+async def status_poll(job_id: str) -> StatusPollResponse:
+    """Polling endpoint for a job's status."""
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return job_status(job)
+
+@app.websocket("/ws/status")
+async def status_socket(websocket: WebSocket, job_id: str) -> None:
+    """
+    Push a job's status (the /status_poll payload) whenever it changes, at most once per
+    progress.PUSH_INTERVAL. The socket is closed after the error status, or the completed
+    status once trait images are resolved, is sent. Unknown jobs are closed with code 4404.
+    """
+    await websocket.accept()
+    job = jobs.get(job_id)
+    if job is None:
+        await websocket.send_json(StatusPollResponse(status="idle").model_dump())
+        await websocket.close(code=4404)
+        return
     try:
-        progress_path = "generated_annotation/rag_progress.json"
-        if os.path.exists(progress_path):
-            with open(progress_path, 'r') as f:
-                progress_data = json.load(f)
-                
-                # Update status based on progress data if available
-                progress_status = progress_data.get('status')
-                if progress_status == 'in_progress':
-                    # If we're in progress, use the step from progress data as the status
-                    step = progress_data.get('step')
-                    if step and step != current_status and step in StatusPollResponse.__annotations__['status'].__args__:
-                        with state_lock:
-                            state["status"] = step
-                        response.status = step
-                
-                # Update progress information
-                response.step = progress_data.get('step')
-                response.current = progress_data.get('current', 0)
-                response.total = progress_data.get('total', 1)
-                response.progress = progress_data.get('percentage', 0)
-                response.message = f"{response.step}: {response.progress}%"
-                
-    except json.JSONDecodeError as e:
-        logging.error(f"Error decoding progress file: {e}")
-    except Exception as e:
-        logging.error(f"Error reading progress file: {e}")
-    
-    return response
+        async for _ in get_progress_bus().subscribe(job.job_id):
+            status = job_status(job)
+            await websocket.send_json(status.model_dump())
+            if status.status == "error" or (status.status == "completed" and not status.images_pending):
+                break
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
 
 class ResultsResponse(BaseModel):
     results: List[TraitSummary]
+    # True while images are still being filled in; fetch again once it is False
+    images_pending: bool = False
 
 @app.get("/results")
-async def results() -> ResultsResponse:
-    with trait_results_lock:
-        return ResultsResponse(results=trait_results)
+async def results(job_id: str) -> ResultsResponse:
+    """Results of a finished job."""
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    with job.lock:
+        return ResultsResponse(results=list(job.results), images_pending=job.images_pending)
+
+
+class CacheInvalidationResponse(BaseModel):
+    removed: int
+
+@app.delete("/results_cache")
+async def invalidate_results_cache(sha256: Optional[str] = None) -> CacheInvalidationResponse:
+    """Drop cached results for one uploaded file's content hash, or for every file."""
+    removed = await asyncio.to_thread(get_result_cache().invalidate, sha256)
+    return CacheInvalidationResponse(removed=removed)
+
+@app.websocket("/ws/chat")
+async def chat_socket(websocket: WebSocket, job_id: str) -> None:
+    """
+    Chat about a completed job's results.
+    The client sends {"question": "..."}; the server replies with {"type": "sources",
+    "pmids": [...]}, then {"type": "token", "text": "..."} messages as the answer is
+    generated, then {"type": "done"}. Errors in a turn are sent as {"type": "error"}.
+    """
+    from chat import ChatSession
+    await websocket.accept()
+    job = jobs.get(job_id)
+    if job is None or job.status != "completed":
+        message = "Unknown job" if job is None else "Analysis has not completed"
+        await websocket.send_json({"type": "error", "message": message})
+        await websocket.close(code=4404 if job is None else 4409)
+        return
+    with job.lock:
+        trait_titles = [summary.trait_title for summary in job.results]
+        associations = list(job.associations)
+    try:
+        session = ChatSession(trait_titles, associations)
+        await session.start()
+        while True:
+            message = await websocket.receive_json()
+            question = str(message.get("question", "")).strip() if isinstance(message, dict) else ""
+            if not question:
+                await websocket.send_json({"type": "error", "message": "Empty question"})
+                continue
+            try:
+                pmids = await session.retrieve(question)
+                await websocket.send_json({"type": "sources", "pmids": pmids})
+                async for text in session.ask(question, pmids):
+                    await websocket.send_json({"type": "token", "text": text})
+                await websocket.send_json({"type": "done"})
+            except WebSocketDisconnect:
+                raise
+            except Exception as e:
+                logging.error(f"Chat turn for job {job.job_id} failed: {e}")
+                await websocket.send_json({"type": "error", "message": str(e)})
+    except WebSocketDisconnect:
+        pass
+    except ValueError as e:
+        # Missing API key, or a message that is not JSON
+        await websocket.send_json({"type": "error", "message": str(e)})
+        await websocket.close(code=1011)
+
+
+class HostStats(BaseModel):
+    requests: int
+    throttled: int
+    rate_limit: Optional[float] = None
+    queue_wait_mean: float
+    queue_wait_max: float
+
+@app.get("/http_stats")
+async def http_stats() -> Dict[str, HostStats]:
+    """Outbound request statistics per host: attempts, 429s, rate limit and queue wait in seconds."""
+    return {host: HostStats(**stats) for host, stats in get_engine().stats().items()}
 
 
 class HealthResponse(BaseModel):
@@ -0,0 +1,73 @@
+"""
+Single-flight module: concurrent requests for the same key share one in-flight call, so
+duplicate rsID and PMID lookups, within a job or across jobs, reach the network once.
+"""
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Iterable, List, TypeVar
+
+T = TypeVar("T")
+
+class SingleFlight:
+    """
+    Registry of in-flight calls by key. The first caller for a key starts the call as a
+    task; later callers await the same task until it finishes, after which the key is free
+    again (results are not kept, so callers cache them where appropriate). The task is
+    shielded, so a cancelled caller does not cancel it for the others. All callers must run
+    on the same event loop (the HTTP engine's).
+    """
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._inflight: Dict[str, "asyncio.Future"] = {}
+        # Keys requested, and keys that joined a call already in flight
+        self.requested = 0
+        self.shared = 0
+
+    def _start(self, keys: List[str], coro: Awaitable) -> "asyncio.Future":
+        task = asyncio.ensure_future(coro)
+        for key in keys:
+            self._inflight[key] = task
+
+        def release(finished: "asyncio.Future") -> None:
+            for key in keys:
+                if self._inflight.get(key) is finished:
+                    del self._inflight[key]
+        task.add_done_callback(release)
+        return task
+
+    async def do(self, key: str, call: Callable[[], Awaitable[T]]) -> T:
+        """Return call()'s result, sharing one call among concurrent callers with the same key."""
+        self.requested += 1
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._start([key], call())
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+    async def do_many(self, keys: Iterable[str], call: Callable[[List[str]], Awaitable[Dict[str, T]]]) -> Dict[str, T]:
+        """
+        Batch variant of do: keys already in flight join their existing calls, and the rest
+        are passed to one new call(missing_keys), which returns a value per key it resolved.
+        A call that fails only drops its own keys; values from the other calls are kept.
+        Returns:
+            Dict[str, T]: Values for the requested keys that were resolved.
+        """
+        keys = list(dict.fromkeys(keys))
+        self.requested += len(keys)
+        missing = [key for key in keys if key not in self._inflight]
+        self.shared += len(keys) - len(missing)
+        if missing:
+            self._start(missing, call(missing))
+        tasks = {id(task): task for task in (self._inflight[key] for key in keys)}
+        results: Dict[str, T] = {}
+        outcomes = await asyncio.gather(*(asyncio.shield(task) for task in tasks.values()), return_exceptions=True)
+        for values in outcomes:
+            if isinstance(values, BaseException):
+                logging.warning(f"{self.name} lookup failed: {values!r}")
+                continue
+            results.update(values)
+        return {key: results[key] for key in keys if key in results}
+
+    def stats(self) -> Dict[str, int]:
+        return {"requested": self.requested, "shared": self.shared, "in_flight": len(self._inflight)}
@@ -0,0 +1,27 @@
+"""
+Singleton module: process-wide objects (caches, indexes, the HTTP engine, the progress bus)
+that are created on first use and then shared by every job and thread.
+"""
+import functools
+import threading
+from typing import Callable, List, TypeVar
+
+T = TypeVar("T")
+
+def process_wide(factory: Callable[[], T]) -> Callable[[], T]:
+    """
+    Decorator turning a zero-argument factory into a getter for one shared instance.
+    The first call runs the factory under a lock, so concurrent first callers (job threads,
+    the engine loop) never create two; later calls return the instance without locking.
+    """
+    lock = threading.Lock()
+    instance: List[T] = []
+
+    @functools.wraps(factory)
+    def get() -> T:
+        if not instance:
+            with lock:
+                if not instance:
+                    instance.append(factory())
+        return instance[0]
+    return get
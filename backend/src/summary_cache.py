@@ -0,0 +1,76 @@
+"""
+Summary cache module: LLM trait summaries stored under a canonical hash of the GWAS
+associations they were generated from, the prompt template version and the model, so
+associations shared between analyses are only summarised once.
+"""
+import os
+import json
+import hashlib
+from typing import Any, Dict, List
+from cache import KVCache
+from singleton import process_wide
+
+# Compressed bytes kept before least recently used summaries are evicted
+SUMMARY_CACHE_MAX_BYTES = int(os.getenv("SUMMARY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Association fields that reach the prompt; the abstract is determined by the PMID
+ASSOCIATION_KEY_FIELDS = (
+    "rsid_from_vep", "traitName", "pubmedId", "OR", "beta", "pValue",
+    "riskAllele_GWAS", "gene_symbol_from_vep",
+)
+
+def canonical_association(record: Dict[str, Any]) -> str:
+    """Serialise the key fields of one association record in a stable form."""
+    def normalise(value: Any) -> Any:
+        if isinstance(value, list):
+            return [normalise(item) for item in value]
+        return " ".join(str(value).split())
+
+    fields = {name: normalise(record.get(name)) for name in ASSOCIATION_KEY_FIELDS}
+    return json.dumps(fields, sort_keys=True, separators=(",", ":"))
+
+def trait_group_key(records: List[Dict[str, Any]]) -> str:
+    """
+    Key for the summary of one trait's association records: independent of record order,
+    and specific to the summary prompt version and model.
+    """
+    from agent import GEN_MODEL, SUMMARY_PROMPT_VERSION
+
+    canonical = sorted(canonical_association(record) for record in records)
+    payload = json.dumps({
+        "prompt_version": SUMMARY_PROMPT_VERSION,
+        "gen_model": GEN_MODEL,
+        "associations": canonical,
+    }, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class SummaryCache:
+    """Per-trait LLM summaries keyed by trait_group_key."""
+    def __init__(self, max_bytes: int = SUMMARY_CACHE_MAX_BYTES) -> None:
+        self._store = KVCache("trait_summaries", max_bytes=max_bytes)
+
+    def get_many(self, groups: Dict[str, List[Dict[str, Any]]]) -> Dict[str, Dict[str, Any]]:
+        """
+        Look up cached summaries for trait groups.
+        Args:
+            groups (Dict[str, List[Dict]]): Association records per normalised trait name.
+        Returns:
+            Dict[str, Dict]: Cached summary per trait name; uncached traits are absent.
+        """
+        keys = {name: trait_group_key(records) for name, records in groups.items()}
+        found = self._store.get_many(keys.values())
+        return {name: found[key] for name, key in keys.items() if key in found}
+
+    def put_many(self, summaries: Dict[str, Dict[str, Any]], groups: Dict[str, List[Dict[str, Any]]]) -> None:
+        """Store summaries per trait name under the key of that trait's association records."""
+        self._store.put_many({
+            trait_group_key(groups[name]): summary
+            for name, summary in summaries.items() if name in groups
+        })
+
+    def stats(self) -> Dict[str, int]:
+        return self._store.stats()
+
+@process_wide
+def get_summary_cache() -> SummaryCache:
+    """Return the process-wide summary cache, opening it on first use."""
+    return SummaryCache()
@@ -0,0 +1,72 @@
+"""
+Uploads module for storing uploaded VCFs on disk in constant memory, named by the SHA-256
+of their content.
+"""
+import os
+import hashlib
+import logging
+import tempfile
+from pathlib import Path
+from typing import BinaryIO, Optional, Tuple
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+GZIP_MAGIC = b"\x1f\x8b"
+VCF_SUFFIXES = (".vcf", ".vcf.gz", ".vcf.bgz")
+
+def upload_suffix(filename: str, first_bytes: bytes) -> str:
+    """
+    Choose the stored suffix from the content: gzip (and BGZF) streams become .vcf.gz,
+    anything else .vcf. Raises ValueError for names that are not VCFs. RData files are
+    rejected as well: analyses stream VCF text, so an uploaded .rdata could never be annotated.
+    """
+    if filename and not filename.lower().endswith(VCF_SUFFIXES):
+        raise ValueError(f"Unsupported file type: {filename} (expected {', '.join(VCF_SUFFIXES)})")
+    return ".vcf.gz" if first_bytes.startswith(GZIP_MAGIC) else ".vcf"
+
+def store_upload(source: BinaryIO, upload_dir: Path, filename: str) -> Tuple[str, str, int]:
+    """
+    Copy an uploaded file to upload_dir in UPLOAD_CHUNK_SIZE chunks while hashing it.
+    The copy goes to a temporary file that is renamed to <sha256><suffix>; if a file with
+    that hash is already stored, the copy is discarded.
+    Args:
+        source (BinaryIO): The upload's file object, read sequentially.
+        upload_dir (Path): Directory for stored uploads.
+        filename (str): The client's filename, used to reject non-VCF uploads.
+    Returns:
+        Tuple[str, str, int]: Stored filename, hex SHA-256 and size in bytes.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    suffix: Optional[str] = None
+    fd, tmp_path = tempfile.mkstemp(dir=upload_dir, prefix=".upload-")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = source.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                if suffix is None:
+                    suffix = upload_suffix(filename, chunk)
+                digest.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+        if suffix is None:
+            raise ValueError("Uploaded file is empty")
+        sha256 = digest.hexdigest()
+        stored_name = f"{sha256}{suffix}"
+        stored_path = upload_dir / stored_name
+        if stored_path.exists():
+            logging.info(f"Upload {filename} matches stored file {stored_name}")
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, stored_path)
+        return stored_name, sha256, size
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def upload_sha256(stored_name: str) -> Optional[str]:
+    """Return the content hash encoded in a stored upload's name, if it is hash-named."""
+    stem = stored_name.split(".", 1)[0]
+    return stem if len(stem) == 64 and all(c in "0123456789abcdef" for c in stem) else None
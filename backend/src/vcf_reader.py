@@ -0,0 +1,39 @@
+"""
+VCF reader module: opens plain or gzip-compressed VCFs as text while tracking how far
+through the file on disk reading has got, so long annotation runs can report real progress.
+"""
+import gzip
+import io
+import os
+from typing import Iterator
+
+class VCFReader:
+    """
+    Line iterator over a plain or gzip-compressed VCF. bytes_read is the offset into the file
+    on disk, which for .gz input is the compressed offset, so bytes_read / size measures
+    progress without knowing the number of variants or the uncompressed size up front.
+    Offsets advance in read-buffer steps, which is ample resolution for a progress bar.
+    """
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.size = os.path.getsize(path)
+        self._raw = open(path, "rb")
+        stream = gzip.GzipFile(fileobj=self._raw) if path.endswith(".gz") else self._raw
+        self._text = io.TextIOWrapper(stream, encoding="utf-8")
+
+    @property
+    def bytes_read(self) -> int:
+        return self.size if self._raw.closed else min(self._raw.tell(), self.size)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._text)
+
+    def close(self) -> None:
+        self._text.close()
+        self._raw.close()
+
+    def __enter__(self) -> "VCFReader":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
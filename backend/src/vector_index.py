@@ -0,0 +1,324 @@
+"""
+Vector index module: PubMed abstract embeddings stored as a memory-mapped float32 matrix
+with a PMID sidecar, searched by cosine similarity, with an optional approximate (IVF)
+index for large corpora. Each abstract is embedded once, when its PMID is first indexed.
+
+Usage:
+    poetry run python src/vector_index.py build             # index every stored abstract
+    poetry run python src/vector_index.py ann [n_lists]     # build the approximate index
+    poetry run python src/vector_index.py search "query" [k]
+"""
+import os
+import sys
+import json
+import time
+import logging
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+from cache import CACHE_DIR
+from embeddings import EMBEDDING_MODEL
+from singleton import process_wide
+
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR", os.path.join(CACHE_DIR, "vector_index"))
+VECTORS_FILE = "vectors.f32"
+PMIDS_FILE = "pmids.txt"
+META_FILE = "meta.json"
+ANN_FILE = "ann.npz"
+# Searches use the approximate index, when one is built, from this many vectors
+ANN_MIN_VECTORS = int(os.getenv("ANN_MIN_VECTORS", "50000"))
+# Inverted lists scanned per approximate search
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", "8"))
+# Abstracts embedded and appended per step while indexing, so progress survives interruptions
+INDEX_BATCH_SIZE = 500
+# Rows scored per matrix product, bounding temporary memory on large indexes
+SEARCH_CHUNK_ROWS = 65536
+
+def _normalise(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1
+    return (vectors / norms).astype(np.float32, copy=False)
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Positions of the k highest scores, best first."""
+    if k >= len(scores):
+        return np.argsort(-scores, kind="stable")
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+def _nearest_centroids(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    assignments = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), SEARCH_CHUNK_ROWS):
+        chunk = np.asarray(vectors[start:start + SEARCH_CHUNK_ROWS])
+        assignments[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+    return assignments
+
+class VectorIndex:
+    """
+    Append-only store of unit-normalised float32 embeddings, one row per PMID.
+    vectors.f32 holds the rows back to back, pmids.txt the PMID of each row and meta.json
+    the row count and dimension. meta.json is replaced last on every append, so rows left
+    by an interrupted append are ignored and truncated on the next open. The matrix is
+    memory-mapped, so searches only page in the rows they touch. One process should write
+    an index; any number of threads may search it.
+    """
+    def __init__(self, index_dir: str = VECTOR_INDEX_DIR, model: str = EMBEDDING_MODEL) -> None:
+        """
+        Open (or create) the index for an embedding model.
+        Args:
+            index_dir (str): Root directory; each embedding model gets its own subdirectory,
+                since vectors from different models are not comparable.
+            model (str): Embedding model name.
+        """
+        self.model = model
+        self.index_dir = os.path.join(index_dir, model.replace("/", "_"))
+        os.makedirs(self.index_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        # Serialises index_abstracts so concurrent callers never embed the same PMID twice
+        self._indexing_lock = threading.Lock()
+        meta = self._read_meta()
+        self.dim: Optional[int] = meta.get("dim")
+        self.count: int = meta.get("count", 0)
+        self.pmids = self._read_pmids()
+        self._rows = {pmid: row for row, pmid in enumerate(self.pmids)}
+        self._truncate()
+        self._matrix = self._map()
+        self._ann = self._load_ann()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.index_dir, name)
+
+    def _read_meta(self) -> Dict[str, Any]:
+        if not os.path.exists(self._path(META_FILE)):
+            return {}
+        with open(self._path(META_FILE)) as f:
+            return json.load(f)
+
+    def _write_meta(self) -> None:
+        tmp_path = self._path(META_FILE + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"model": self.model, "dim": self.dim, "count": self.count, "updated": time.time()}, f)
+        os.replace(tmp_path, self._path(META_FILE))
+
+    def _read_pmids(self) -> List[str]:
+        if not self.count:
+            return []
+        with open(self._path(PMIDS_FILE)) as f:
+            return [line.rstrip("\n") for _, line in zip(range(self.count), f)]
+
+    def _truncate(self) -> None:
+        """Drop vectors and PMIDs past count, left by an interrupted append."""
+        vectors_size = self.count * (self.dim or 0) * 4
+        pmids_size = sum(len(pmid.encode("utf-8")) + 1 for pmid in self.pmids)
+        for name, size in ((VECTORS_FILE, vectors_size), (PMIDS_FILE, pmids_size)):
+            path = self._path(name)
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                os.truncate(path, size)
+
+    def _map(self) -> Optional[np.ndarray]:
+        if not self.count:
+            return None
+        return np.memmap(self._path(VECTORS_FILE), dtype=np.float32, mode="r", shape=(self.count, self.dim))
+
+    def _load_ann(self) -> Optional[Dict[str, np.ndarray]]:
+        path = self._path(ANN_FILE)
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            ann = {name: data[name] for name in data.files}
+        if int(ann["count"]) > self.count or ann["centroids"].shape[1] != self.dim:
+            logging.warning(f"Ignoring approximate index in {self.index_dir}: it does not match the vectors")
+            return None
+        return ann
+
+    def missing(self, pmids: Iterable[str]) -> List[str]:
+        """Return the PMIDs (deduplicated, in order) that have no vector yet."""
+        with self._lock:
+            return [pmid for pmid in dict.fromkeys(pmids) if pmid not in self._rows]
+
+    def add(self, pmids: Sequence[str], vectors: np.ndarray) -> int:
+        """
+        Append embeddings for PMIDs that are not indexed yet; others are skipped.
+        Args:
+            pmids (Sequence[str]): PMID of each row.
+            vectors (np.ndarray): Embedding matrix with one row per PMID.
+        Returns:
+            int: Number of rows added.
+        Raises:
+            ValueError: If the shapes do not match each other or the index's dimension.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim != 2 or len(vectors) != len(pmids):
+            raise ValueError(f"Expected {len(pmids)} embedding rows, got shape {vectors.shape}")
+        with self._lock:
+            if self.dim is not None and vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match the index ({self.dim})")
+            keep: Dict[str, int] = {}
+            for i, pmid in enumerate(pmids):
+                if pmid not in self._rows and pmid not in keep:
+                    keep[pmid] = i
+            if not keep:
+                return 0
+            self.dim = vectors.shape[1]
+            rows = _normalise(vectors[list(keep.values())])
+            with open(self._path(VECTORS_FILE), "ab") as f:
+                f.write(rows.tobytes())
+            with open(self._path(PMIDS_FILE), "a") as f:
+                f.write("".join(f"{pmid}\n" for pmid in keep))
+            for pmid in keep:
+                self._rows[pmid] = len(self.pmids)
+                self.pmids.append(pmid)
+            self.count += len(keep)
+            self._write_meta()
+            self._matrix = self._map()
+            return len(keep)
+
+    def index_abstracts(self, abstracts: Dict[str, Optional[str]], embedder: Optional[Any] = None) -> int:
+        """
+        Embed and add the abstracts whose PMIDs are not indexed yet, INDEX_BATCH_SIZE at a time.
+        Args:
+            abstracts (Dict[str, Optional[str]]): Abstract text per PMID; empty ones are skipped.
+            embedder (Optional[Embedder]): Embedding client; created on demand if needed.
+        Returns:
+            int: Number of abstracts added.
+        """
+        with self._indexing_lock:
+            pmids = [pmid for pmid in self.missing(abstracts) if abstracts[pmid]]
+            if not pmids:
+                return 0
+            if embedder is None:
+                from embeddings import Embedder
+                embedder = Embedder(self.model)
+            added = 0
+            for start in range(0, len(pmids), INDEX_BATCH_SIZE):
+                batch = pmids[start:start + INDEX_BATCH_SIZE]
+                vectors = embedder.embed_batch([abstracts[pmid] for pmid in batch])
+                added += self.add(batch, vectors)
+            logging.info(f"Indexed {added} abstracts ({self.count} in {self.index_dir})")
+            return added
+
+    def search(self, query: np.ndarray, k: int = 5, pmids: Optional[Iterable[str]] = None,
+               approximate: Optional[bool] = None) -> List[Tuple[str, float]]:
+        """
+        Return the indexed PMIDs most similar to a query embedding, by cosine similarity.
+        Args:
+            query (np.ndarray): Query embedding (normalised here).
+            k (int): Number of results.
+            pmids (Optional[Iterable[str]]): Restrict the search to these PMIDs (e.g. one
+                analysis' abstracts); the restricted search is always exact.
+            approximate (Optional[bool]): Scan only the ANN_NPROBE nearest inverted lists of
+                the approximate index. Defaults to True when it is built and the index holds
+                at least ANN_MIN_VECTORS vectors.
+        Returns:
+            List[Tuple[str, float]]: (PMID, cosine similarity), best first.
+        """
+        with self._lock:
+            matrix, ann, count = self._matrix, self._ann, self.count
+            rows = None
+            if pmids is not None:
+                rows = np.array(sorted({self._rows[pmid] for pmid in pmids if pmid in self._rows}), dtype=np.int64)
+        if matrix is None or k <= 0:
+            return []
+        query = _normalise(np.asarray(query, dtype=np.float32).reshape(-1))
+        if query.shape[0] != self.dim:
+            raise ValueError(f"Query dimension {query.shape[0]} does not match the index ({self.dim})")
+
+        if rows is None and ann is not None and (approximate or (approximate is None and count >= ANN_MIN_VECTORS)):
+            rows = self._ann_candidates(query, ann, count)
+        if rows is None:
+            scores = np.empty(count, dtype=np.float32)
+            for start in range(0, count, SEARCH_CHUNK_ROWS):
+                scores[start:start + SEARCH_CHUNK_ROWS] = matrix[start:start + SEARCH_CHUNK_ROWS] @ query
+            top = _top_k(scores, k)
+            return [(self.pmids[row], float(scores[row])) for row in top]
+        scores = matrix[rows] @ query
+        top = _top_k(scores, k)
+        return [(self.pmids[rows[i]], float(scores[i])) for i in top]
+
+    @staticmethod
+    def _ann_candidates(query: np.ndarray, ann: Dict[str, np.ndarray], count: int) -> np.ndarray:
+        """Rows in the probed inverted lists, plus every row added since the index was built."""
+        offsets, order = ann["offsets"], ann["order"]
+        probed = _top_k(ann["centroids"] @ query, ANN_NPROBE)
+        parts = [order[offsets[l]:offsets[l + 1]] for l in probed]
+        parts.append(np.arange(int(ann["count"]), count, dtype=order.dtype))
+        # Sorted rows keep reads from the memory map sequential
+        return np.sort(np.concatenate(parts))
+
+    def build_ann(self, n_lists: Optional[int] = None, iterations: int = 10, seed: int = 0) -> int:
+        """
+        Build the approximate index: spherical k-means centroids trained on a sample of the
+        vectors, and an inverted list of rows per centroid. Rows added later are scanned
+        exactly until the next build.
+        Args:
+            n_lists (Optional[int]): Number of inverted lists; defaults to sqrt(count).
+            iterations (int): k-means iterations.
+            seed (int): Sampling seed.
+        Returns:
+            int: Number of lists built (0 for an empty index).
+        """
+        with self._lock:
+            matrix, count = self._matrix, self.count
+        if matrix is None:
+            return 0
+        n_lists = min(n_lists or max(1, int(np.sqrt(count))), count)
+        rng = np.random.default_rng(seed)
+        sample = np.asarray(matrix[np.sort(rng.choice(count, size=min(count, n_lists * 64), replace=False))])
+        centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)].copy()
+        for _ in range(iterations):
+            assignments = _nearest_centroids(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            empty = np.bincount(assignments, minlength=n_lists) == 0
+            sums[empty] = centroids[empty]
+            centroids = _normalise(sums)
+
+        assignments = _nearest_centroids(matrix, centroids)
+        order = np.argsort(assignments, kind="stable")
+        offsets = np.searchsorted(assignments[order], np.arange(n_lists + 1))
+        ann = {"centroids": centroids, "order": order, "offsets": offsets, "count": np.int64(count)}
+        tmp_path = self._path(ANN_FILE + ".tmp")
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **ann)
+        os.replace(tmp_path, self._path(ANN_FILE))
+        with self._lock:
+            self._ann = ann
+        logging.info(f"Built approximate index with {n_lists} lists over {count} vectors")
+        return n_lists
+
+@process_wide
+def get_vector_index() -> VectorIndex:
+    """Return the process-wide vector index for EMBEDDING_MODEL, opening it on first use."""
+    return VectorIndex()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) < 2 or sys.argv[1] not in ("build", "ann", "search") or (sys.argv[1] == "search" and len(sys.argv) < 3):
+        print("Usage: poetry run python src/vector_index.py build\n"
+              "       poetry run python src/vector_index.py ann [n_lists]\n"
+              "       poetry run python src/vector_index.py search <query> [k]")
+        sys.exit(1)
+    index = get_vector_index()
+    if sys.argv[1] == "build":
+        from cache import KVCache
+        from embeddings import Embedder
+        embedder = Embedder(index.model)
+        added, batch = 0, {}
+        for pmid, abstract in KVCache("pubmed_abstracts").items():
+            batch[pmid] = abstract
+            if len(batch) >= INDEX_BATCH_SIZE:
+                added += index.index_abstracts(batch, embedder)
+                batch = {}
+        added += index.index_abstracts(batch, embedder)
+        print(f"Added {added} abstracts; {index.count} indexed in {index.index_dir}")
+    elif sys.argv[1] == "ann":
+        n_lists = index.build_ann(int(sys.argv[2]) if len(sys.argv) > 2 else None)
+        print(f"Built {n_lists} inverted lists over {index.count} vectors")
+    else:
+        from embeddings import Embedder
+        query = Embedder(index.model).embed_batch([sys.argv[2]], task_type="RETRIEVAL_QUERY")[0]
+        started = time.perf_counter()
+        hits = index.search(query, int(sys.argv[3]) if len(sys.argv) > 3 else 5)
+        print(f"Searched {index.count} vectors in {(time.perf_counter() - started) * 1000:.1f} ms")
+        for pmid, score in hits:
+            print(f"{score:.4f}  PMID {pmid}")
@@ -1,30 +1,107 @@
-import requests
+import asyncio
 import json
-import gzip
+import hashlib
+import os
 import sys
 import time
-import random
-import threading
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import re
+import httpx
+from cache import KVCache
+from http_engine import get_engine, retry_after_seconds
+from progress import DEFAULT_TOPIC, get_progress_bus
+from singleton import process_wide
+from vcf_reader import VCFReader
 
 # --- Configuration ---
 SERVER = "https://rest.ensembl.org"
 SPECIES = "human"
 VEP_ENDPOINT = f"/vep/{SPECIES}/region"
-# Increased BATCH_SIZE to 500. Ensembl generally allows up to 1000,
-# but 500 is a good balance for testing throughput without hitting issues too fast.
-BATCH_SIZE = 200
-
-# --- VEP API Parameters (Optional) ---
-VEP_PARAMS = {
-    "ClinVar": 1,
-    "sift": 1,
-    "polyphen": 1,
-    "conservation": 1, # Add conservation scores (e.g., PhyloP, phastCons)
-    "canonical": 1, # Only return consequences for canonical transcripts
-    "gene_phenotype": 1, # Add gene-phenotype
-    "dbSNP": 1, # get rsID
+# Starting batch size. VEPRateController grows or shrinks it between MIN_BATCH_SIZE and
+# MAX_BATCH_SIZE; the Ensembl VEP region endpoint rejects POSTs of more than 200 variants.
+BATCH_SIZE = 100
+MIN_BATCH_SIZE = 25
+MAX_BATCH_SIZE = int(os.getenv("VEP_MAX_BATCH_SIZE", "200"))
+BATCH_SIZE_STEP = 25
+# Concurrent requests at start-up; the controller raises this up to max_workers while healthy
+INITIAL_CONCURRENCY = 8
+# Batches slower than this are treated as a sign of server load
+TARGET_BATCH_LATENCY = 30.0
+# Multiplicative decrease applied to batch size and concurrency on 429/5xx responses
+DECREASE_FACTOR = 0.5
+# A 413, or a 400 whose message mentions a size limit, means the POST was too large: the
+# batch is split and retried. Other 400s reject a malformed variant, which is isolated and dropped.
+_OVERSIZE_MESSAGE_RE = re.compile(r"too (large|many)|maximum|limit", re.I)
+# Returned by send_vep_batch for a 400 it was asked not to isolate
+_REJECTED = object()
+# Upper bound on batches read from the input but not yet completed, as a multiple of max_workers.
+# Keeps memory flat for whole-genome inputs while the request slots stay saturated.
+MAX_PENDING_BATCHES_FACTOR = 2
+
+# --- VEP API Parameters ---
+# Request profiles, selected with the VEP_PROFILE environment variable.
+# "full" asks for everything the original pipeline requested. "lean" asks only for what the
+# damaging-variant filter reads: prediction labels without scores, no co-located variants
+# (the rsID comes from the input line), no conservation or phenotype blocks and no intergenic
+# consequences; it yields the same damaging tuples. "most_severe" additionally lets VEP keep a
+# single consequence per allele and gene, ranked by severity, for the smallest payloads
+# (a MODERATE call may then be judged on a different transcript's SIFT/PolyPhen predictions).
+VEP_PROFILES = {
+    "full": {
+        "ClinVar": 1,
+        "sift": 1,
+        "polyphen": 1,
+        "conservation": 1, # Add conservation scores (e.g., PhyloP, phastCons)
+        "canonical": 1, # Flag canonical transcripts
+        "gene_phenotype": 1, # Add gene-phenotype
+        "dbSNP": 1, # get rsID
+    },
+    "lean": {
+        "sift": "p",
+        "polyphen": "p",
+        "check_existing": 0,
+        "no_intergenic": 1,
+    },
+    "most_severe": {
+        "sift": "p",
+        "polyphen": "p",
+        "check_existing": 0,
+        "no_intergenic": 1,
+        "pick_allele_gene": 1,
+        "pick_order": "rank,mane_select,canonical,appris,tsl,biotype,ccds,length",
+    },
 }
+VEP_PROFILE = os.getenv("VEP_PROFILE", "lean")
+if VEP_PROFILE not in VEP_PROFILES:
+    raise ValueError(f"Unknown VEP_PROFILE {VEP_PROFILE!r}; expected one of {', '.join(VEP_PROFILES)}")
+VEP_PARAMS = VEP_PROFILES[VEP_PROFILE]
+
+# Cached annotations are keyed by the parsed variant string plus a fingerprint of VEP_PARAMS,
+# so changing the request options (or profile) never returns stale results.
+VEP_PARAMS_HASH = hashlib.sha256(json.dumps(VEP_PARAMS, sort_keys=True).encode()).hexdigest()[:16]
+@process_wide
+def get_vep_cache():
+    """Return the process-wide VEP annotation cache, opening it on first use."""
+    return KVCache("vep_annotations")
+
+def vep_cache_key(variant):
+    return f"{VEP_PARAMS_HASH}:{variant}"
+
+# --- Field projection ---
+# Only these fields are read downstream (RAG.find_damaging_variants_info); everything else
+# in a VEP result is dropped as soon as the response is decoded.
+PROJECTED_VARIANT_FIELDS = ("id", "input")
+PROJECTED_CONSEQUENCE_FIELDS = ("gene_symbol", "variant_allele", "impact", "sift_prediction", "polyphen_prediction")
+
+def project_vep_annotation(annotation):
+    """Reduce a VEP result to the variant and transcript-consequence fields used downstream."""
+    projected = {field: annotation[field] for field in PROJECTED_VARIANT_FIELDS if field in annotation}
+    consequences = annotation.get("transcript_consequences")
+    if isinstance(consequences, list):
+        projected["transcript_consequences"] = [
+            {field: tc[field] for field in PROJECTED_CONSEQUENCE_FIELDS if field in tc}
+            for tc in consequences if isinstance(tc, dict)
+        ]
+    return projected
 
 # --- Function to parse a single VCF line ---
 def parse_vcf_line(line):
@@ -50,11 +127,189 @@ def parse_vcf_line(line):
 
     return f"{chrom} {pos} {_id} {ref} {alt}"
 
+# --- Lazy readers ---
+def iter_vcf_variants(vcf):
+    """
+    Lazily yields VEP input strings from a plain or gzip-compressed VCF file, given its path
+    or an open VCFReader (whose bytes_read then tracks how far the iterator has got).
+    Only one line is held in memory at a time.
+    """
+    reader = vcf if isinstance(vcf, VCFReader) else VCFReader(vcf)
+    with reader:
+        for line in reader:
+            vep_input_string = parse_vcf_line(line)
+            if vep_input_string:
+                yield vep_input_string
+
+def iter_vep_batches(variants, batch_size=BATCH_SIZE):
+    """
+    Groups an iterable of VEP input strings into lists of at most batch_size,
+    yielding each batch as soon as it fills. batch_size may also be a zero-argument
+    callable, which is re-read for every batch so an adaptive controller can resize them.
+    """
+    size = batch_size if callable(batch_size) else (lambda: batch_size)
+    batch = []
+    limit = size()
+    for variant in variants:
+        batch.append(variant)
+        if len(batch) >= limit:
+            yield batch
+            batch = []
+            limit = size()
+    if batch:
+        yield batch
+
+# --- Adaptive batch sizing and concurrency ---
+class VEPRateController:
+    """
+    Additive-increase / multiplicative-decrease controller for VEP batch size and concurrency.
+    Every healthy response adds BATCH_SIZE_STEP variants and one request slot. A 429, a 5xx or
+    a transport error multiplies both by DECREASE_FACTOR, at most once per observed batch
+    latency so a burst of failures counts as one congestion signal. Slow batches and rejected
+    (oversized) POSTs shrink only the batch size, and a rejected size also lowers the ceiling
+    additive increase may reach. Retry-After and exhausted X-RateLimit headers pause new requests until
+    the server's window resets. All methods run on the HTTP engine's event loop.
+    """
+    def __init__(self, max_concurrency, batch_size=BATCH_SIZE):
+        self.max_concurrency = max(1, max_concurrency)
+        self.concurrency = min(INITIAL_CONCURRENCY, self.max_concurrency)
+        self.max_batch_size = MAX_BATCH_SIZE
+        self.batch_size = min(max(batch_size, MIN_BATCH_SIZE), self.max_batch_size)
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.last_decrease = 0.0
+        self.ewma_latency = None
+        self.successes = 0
+        self.throttled = 0
+        self.errors = 0
+        self._slot_freed = asyncio.Event()
+
+    async def acquire(self):
+        """Wait for a request slot, honouring any server-requested pause."""
+        while True:
+            delay = self.paused_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            if self.in_flight < self.concurrency:
+                self.in_flight += 1
+                return
+            self._slot_freed.clear()
+            await self._slot_freed.wait()
+
+    def release(self):
+        self.in_flight -= 1
+        self._slot_freed.set()
+
+    def observe(self, response, latency):
+        """Adjust the operating point after one request attempt (see http_engine.ResponseObserver)."""
+        now = time.monotonic()
+        if response is not None:
+            pause = retry_after_seconds(response)
+            if pause:
+                self.paused_until = max(self.paused_until, now + pause)
+
+        status = response.status_code if response is not None else None
+        if status is None or status == 429 or status >= 500:
+            if status == 429:
+                self.throttled += 1
+            else:
+                self.errors += 1
+            self._decrease(now, batch_only=False, reason=f"HTTP {status}" if status else "transport error")
+            return
+        if is_oversize_response(response):
+            self.errors += 1
+            self._decrease(now, batch_only=True, reason=f"HTTP {status}")
+            return
+        if status >= 400:
+            self.errors += 1
+            return
+
+        self.successes += 1
+        self.ewma_latency = latency if self.ewma_latency is None else 0.8 * self.ewma_latency + 0.2 * latency
+        if latency > TARGET_BATCH_LATENCY:
+            self._decrease(now, batch_only=True, reason=f"slow batch ({latency:.1f}s)")
+            return
+        self.batch_size = min(self.batch_size + BATCH_SIZE_STEP, self.max_batch_size)
+        if self.concurrency < self.max_concurrency:
+            self.concurrency += 1
+            self._slot_freed.set()
+
+    def _decrease(self, now, batch_only, reason):
+        if now - self.last_decrease < (self.ewma_latency or 1.0):
+            return
+        self.last_decrease = now
+        self.batch_size = max(MIN_BATCH_SIZE, int(self.batch_size * DECREASE_FACTOR))
+        if not batch_only:
+            self.concurrency = max(1, int(self.concurrency * DECREASE_FACTOR))
+        print(f"VEP backing off after {reason}: {self.operating_point()}")
+
+    def reject_batch_size(self, size):
+        """Keep future batches below a size the server rejected."""
+        self.max_batch_size = max(MIN_BATCH_SIZE, min(self.max_batch_size, size - BATCH_SIZE_STEP))
+        self.batch_size = min(self.batch_size, self.max_batch_size)
+
+    def operating_point(self):
+        """Return the current batch size, concurrency and health counters."""
+        return {
+            "batch_size": self.batch_size,
+            "max_batch_size": self.max_batch_size,
+            "concurrency": self.concurrency,
+            "in_flight": self.in_flight,
+            "ewma_latency_s": round(self.ewma_latency, 2) if self.ewma_latency is not None else None,
+            "successes": self.successes,
+            "throttled": self.throttled,
+            "errors": self.errors,
+        }
+
 # --- Function to send a single batch to VEP ---
-def send_vep_batch(variants, batch_index, attempt=1, max_attempts=5):
+# --- Response size accounting ---
+class VEPPayloadStats:
+    """Accumulates response sizes and JSON decode times for VEP batches."""
+    def __init__(self):
+        self.batches = 0
+        self.variants = 0
+        self.wire_bytes = 0
+        self.body_bytes = 0
+        self.decode_seconds = 0.0
+
+    def record(self, num_variants, wire_bytes, body_bytes, decode_seconds):
+        self.batches += 1
+        self.variants += num_variants
+        self.wire_bytes += wire_bytes
+        self.body_bytes += body_bytes
+        self.decode_seconds += decode_seconds
+
+    def summary(self):
+        """Return totals plus per-variant averages."""
+        per_variant = max(self.variants, 1)
+        return {
+            "profile": VEP_PROFILE,
+            "batches": self.batches,
+            "wire_bytes": self.wire_bytes,
+            "body_bytes": self.body_bytes,
+            "body_bytes_per_variant": round(self.body_bytes / per_variant),
+            "decode_seconds": round(self.decode_seconds, 3),
+            "decode_ms_per_variant": round(1000 * self.decode_seconds / per_variant, 3),
+        }
+
+def is_oversize_response(response):
+    """True for a 413, or a 400 whose message says the POST exceeded the size limit."""
+    if response.status_code == 413:
+        return True
+    return response.status_code == 400 and bool(_OVERSIZE_MESSAGE_RE.search(response.text))
+
+async def send_vep_batch(variants, batch_index, controller=None, payload_stats=None, isolate_rejected=True):
     """
-    Sends a POST request to the VEP API with a batch of variants.
-    Includes basic retry logic with exponential backoff and random jitter.
+    Sends a POST request to the VEP API with a batch of variants through the shared HTTP engine.
+    The engine retries 429s, server errors and connection failures, waiting for Retry-After
+    when the server sends one. With a controller, the request takes one of its slots and
+    every attempt is reported to it. A batch rejected as too large is split in half and both
+    halves are retried, down to MIN_BATCH_SIZE, so an oversized POST does not lose its variants.
+    A batch rejected with any other 400 is searched for the offending variant, which is
+    dropped (see _isolate_rejected_variants); with isolate_rejected=False, _REJECTED is
+    returned instead. The response is decoded in a worker thread; its size and decode time are logged and added
+    to payload_stats when given.
     """
     headers = {"Content-Type": "application/json", "Accept": "application/json"}
     
@@ -64,122 +319,125 @@ def send_vep_batch(variants, batch_index, attempt=1, max_attempts=5):
     payload.update(VEP_PARAMS)
 
     try:
-        r = requests.post(url, headers=headers, data=json.dumps(payload))
+        if controller is None:
+            r = await get_engine().request("POST", url, headers=headers, content=json.dumps(payload))
+        else:
+            await controller.acquire()
+            try:
+                r = await get_engine().request(
+                    "POST", url, headers=headers, content=json.dumps(payload), observer=controller.observe
+                )
+            finally:
+                controller.release()
         r.raise_for_status() # Raise an exception for HTTP errors (4xx or 5xx)
-        print(f"Batch {batch_index} processed successfully (attempt {attempt}).")
-        return r.json()
-    except requests.exceptions.HTTPError as err:
-        if (r.status_code == 429 or r.status_code >= 500) and attempt < max_attempts: # Too Many Requests or Server Errors
-            # Exponential backoff with random jitter
-            sleep_time = (2 ** attempt) + random.uniform(0, 1) # Add up to 1 second of random delay
-            print(f"Batch {batch_index}: HTTP Error {r.status_code}. Retrying in {sleep_time:.2f} seconds (attempt {attempt})...")
-            time.sleep(sleep_time)
-            return send_vep_batch(variants, batch_index, attempt + 1, max_attempts)
+        decode_start = time.perf_counter()
+        result = await asyncio.to_thread(json.loads, r.content)
+        decode_seconds = time.perf_counter() - decode_start
+        print(
+            f"Batch {batch_index} processed successfully "
+            f"({r.num_bytes_downloaded} bytes received, {len(r.content)} decoded in {decode_seconds * 1000:.1f} ms)."
+        )
+        if payload_stats is not None:
+            payload_stats.record(len(variants), r.num_bytes_downloaded, len(r.content), decode_seconds)
+        return result
+    except httpx.HTTPStatusError as err:
+        if is_oversize_response(err.response) and len(variants) > MIN_BATCH_SIZE:
+            print(f"Batch {batch_index} of {len(variants)} variants rejected (HTTP {err.response.status_code}); splitting it.")
+            if controller is not None:
+                controller.reject_batch_size(len(variants))
+            middle = len(variants) // 2
+            halves = await asyncio.gather(
+                send_vep_batch(variants[:middle], batch_index, controller, payload_stats),
+                send_vep_batch(variants[middle:], batch_index, controller, payload_stats),
+            )
+            if all(half is None for half in halves):
+                return None
+            return [annotation for half in halves if half is not None for annotation in half]
+        if err.response.status_code == 400 and not is_oversize_response(err.response):
+            if not isolate_rejected:
+                return _REJECTED
+            if len(variants) > 1:
+                return await _isolate_rejected_variants(variants, batch_index, controller, payload_stats)
+            print(f"Dropping variant rejected by VEP in batch {batch_index}: {variants[0]} ({err.response.text})")
+            return None
         print(f"HTTP error for batch {batch_index}: {err}")
-        print(f"Response content: {r.text}")
+        print(f"Response content: {err.response.text}")
         return None
-    except requests.exceptions.ConnectionError as err:
-        if attempt < max_attempts:
-            sleep_time = (2 ** attempt) + random.uniform(0, 1)
-            print(f"Batch {batch_index}: Connection error. Retrying in {sleep_time:.2f} seconds (attempt {attempt})...")
-            time.sleep(sleep_time)
-            return send_vep_batch(variants, batch_index, attempt + 1, max_attempts)
+    except httpx.TransportError as err:
         print(f"Connection error for batch {batch_index}: {err}")
         return None
-    except requests.exceptions.Timeout as err:
-        if attempt < max_attempts:
-            sleep_time = (2 ** attempt) + random.uniform(0, 1)
-            print(f"Batch {batch_index}: Timeout error. Retrying in {sleep_time:.2f} seconds (attempt {attempt})...")
-            time.sleep(sleep_time)
-            return send_vep_batch(variants, batch_index, attempt + 1, max_attempts)
-        print(f"Timeout error for batch {batch_index}: {err}")
-        return None
-    except requests.exceptions.RequestException as err:
-        print(f"An unknown request error occurred for batch {batch_index}: {err}")
-        return None
     except Exception as e:
         print(f"An unexpected error occurred for batch {batch_index}: {e}")
         return None
 
-# --- Main parallel processing logic ---
-def process_vcf_file_parallel(input_vcf_path, output_json_path, max_workers=30):
+async def _isolate_rejected_variants(variants, batch_index, controller=None, payload_stats=None):
     """
-    Reads a VCF file, batches variants, and sends them to the VEP REST API in parallel.
-    Writes the annotated results to a JSON file.
+    Binary-search a batch VEP rejected with a 400 for the variant that caused it: both halves
+    are sent, and only a rejected half is split further, so a single malformed variant costs
+    about two requests per halving and only that variant is lost. If both halves are rejected
+    the problem is not one variant, and the batch is dropped rather than sent one variant at a time.
     """
-    all_variants_to_process = []
-    
-    open_func = gzip.open if input_vcf_path.endswith('.gz') else open
-    
-    try:
-        with open_func(input_vcf_path, 'rt') as f:
-            for line in f:
-                vep_input_string = parse_vcf_line(line)
-                if vep_input_string:
-                    all_variants_to_process.append(vep_input_string)
-        
-        if not all_variants_to_process:
-            print("No valid variants found in the VCF file. Exiting.")
-            return
+    middle = len(variants) // 2
+    halves = [variants[:middle], variants[middle:]]
+    results = list(await asyncio.gather(*(
+        send_vep_batch(half, batch_index, controller, payload_stats, isolate_rejected=False) for half in halves
+    )))
+    if all(result is _REJECTED for result in results):
+        print(f"Both halves of a rejected part of batch {batch_index} were rejected; dropping its {len(variants)} variants.")
+        return None
+    for i, (half, result) in enumerate(zip(halves, results)):
+        if result is not _REJECTED:
+            continue
+        if len(half) > 1:
+            results[i] = await _isolate_rejected_variants(half, batch_index, controller, payload_stats)
+        else:
+            print(f"Dropping variant rejected by VEP in batch {batch_index}: {half[0]}")
+            results[i] = None
+    if all(result is None for result in results):
+        return None
+    return [annotation for result in results if result is not None for annotation in result]
 
-        total_variants = len(all_variants_to_process)
-        print(f"Found {total_variants} variants to process.")
+# --- Cache-aware batch annotation ---
+async def annotate_batch(variants, batch_index, cache, controller=None, payload_stats=None):
+    """
+    Annotates a batch, sending only cache misses to VEP.
+    Fresh results are projected to the fields used downstream, stored in the cache and
+    merged with cached hits in input order. Returns None if the VEP request for the misses failed.
+    """
+    cached = await asyncio.to_thread(cache.get_many, [vep_cache_key(v) for v in variants])
+    misses = [v for v in variants if vep_cache_key(v) not in cached]
 
-        batches = [
-            all_variants_to_process[i : i + BATCH_SIZE]
-            for i in range(0, total_variants, BATCH_SIZE)
-        ]
-        num_batches = len(batches)
-        print(f"Split into {num_batches} batches, using {max_workers} parallel workers.")
-
-        all_annotations = []
-        start_time = time.time()
-        completed_batches = 0
-        completed_batches_lock = threading.Lock()
-
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            futures = {
-                executor.submit(send_vep_batch, batch, i): i
-                for i, batch in enumerate(batches)
-            }
-
-            for future in as_completed(futures):
-                batch_idx = futures[future]
-                try:
-                    batch_result = future.result()
-                    if batch_result:
-                        all_annotations.extend(batch_result)
-                        print(f"Batch {batch_idx} processed successfully (attempt 1).")
-                    else:
-                        print(f"Batch {batch_idx} failed after all attempts.")
-                except Exception as e:
-                    print(f"Batch {batch_idx} generated an exception: {e}")
-                    continue
-                # Atomically increment completed_batches
-                with completed_batches_lock:
-                    completed_batches += 1
-                    current_completed = completed_batches
-                try:
-                    progress = {
-                        "step": "vep_annotation",
-                        "current": completed_batches,
-                        "total": num_batches,
-                        "percentage": round(100 * completed_batches / num_batches, 1),
-                        "status": "in_progress",
-                        "timestamp": time.time()
-                    }
-                    with open("generated_annotation/rag_progress.json", "w") as pf:
-                        json.dump(progress, pf)
-                except Exception as progress_e:
-                    print(f"Failed to write progress file: {progress_e}")
-            end_time = time.time()
-            print(f"Total processing time: {end_time - start_time:.2f} seconds")
-            print(f"Total VEP results received: {len(all_annotations)}")
-
-            with open(output_json_path, 'w') as outfile:
-                json.dump(all_annotations, outfile, indent=2)
-            print(f"Annotation complete. Results saved to {output_json_path}")
+    fetched = {}
+    if misses:
+        batch_result = await send_vep_batch(misses, batch_index, controller, payload_stats)
+        if batch_result is None:
+            return None
+        for annotation in batch_result:
+            variant = annotation.get("input") if isinstance(annotation, dict) else None
+            if variant:
+                fetched[vep_cache_key(variant)] = project_vep_annotation(annotation)
+        await asyncio.to_thread(cache.put_many, fetched)
+
+    merged = []
+    for variant in variants:
+        annotation = cached.get(vep_cache_key(variant)) or fetched.get(vep_cache_key(variant))
+        if annotation is not None:
+            # Entries cached before projection was introduced still carry full results
+            merged.append(project_vep_annotation(annotation))
+    return merged
 
+# --- Main parallel processing logic ---
+def process_vcf_file_parallel(input_vcf_path, output_json_path=None, max_workers=30):
+    """
+    Streams a VCF file, batches variants, and sends them to the VEP REST API concurrently.
+    Batches are scheduled on the shared HTTP engine as they fill, with at most
+    max_workers * MAX_PENDING_BATCHES_FACTOR in flight, so memory does not grow with the
+    size of the input. Batch size and concurrency (up to max_workers) are tuned by a
+    VEPRateController. Returns the projected annotations in memory, and also writes
+    them to output_json_path when one is given.
+    """
+    try:
+        return get_engine().run(_process_vcf_file_async(input_vcf_path, output_json_path, max_workers))
     except IOError as e:
         print(f"Error reading/writing file: {e}")
         sys.exit(1)
@@ -187,6 +445,124 @@ def process_vcf_file_parallel(input_vcf_path, output_json_path, max_workers=30):
         print(f"An unexpected error occurred during file processing: {e}")
         sys.exit(1)
 
+async def _process_vcf_file_async(input_vcf_path, output_json_path, max_workers):
+    all_annotations = []
+    async for batch_result in stream_vep_annotations(input_vcf_path, max_workers):
+        all_annotations.extend(batch_result)
+
+    if output_json_path:
+        # Serialise in a worker thread so other jobs' requests on the engine loop keep running
+        await asyncio.to_thread(_write_annotations, all_annotations, output_json_path)
+        print(f"Annotation complete. Results saved to {output_json_path}")
+    return all_annotations
+
+def _write_annotations(annotations, output_json_path):
+    with open(output_json_path, 'w') as outfile:
+        json.dump(annotations, outfile, separators=(",", ":"))
+
+def publish_vep_progress(done_bytes, total_bytes):
+    """Default progress callback for stream_vep_annotations: publishes to the progress bus."""
+    get_progress_bus().publish(DEFAULT_TOPIC, {
+        "step": "vep_annotation",
+        "current": done_bytes,
+        "total": total_bytes,
+        "percentage": round(100 * done_bytes / total_bytes, 1) if total_bytes else 0,
+        "status": "in_progress",
+        "timestamp": time.time()
+    })
+
+async def stream_vep_annotations(input_vcf_path, max_workers=30, on_progress=publish_vep_progress):
+    """
+    Async generator that yields each batch's projected VEP annotations as soon as the batch
+    completes (completion order, not input order). Runs on the shared HTTP engine's loop. If the
+    consumer stops pulling, no further batches are read or submitted beyond the pending window.
+    on_progress(done_bytes, total_bytes) is called after every completed batch, where
+    done_bytes is the file offset (compressed, for .gz) up to which every batch has completed
+    and total_bytes the file's size on disk.
+    """
+    max_pending = max_workers * MAX_PENDING_BATCHES_FACTOR
+    cache = get_vep_cache()
+    stats_before = cache.stats()
+    # Concurrent VEP requests are bounded by the controller and, across callers, by the engine's per-host limit
+    controller = VEPRateController(max_workers)
+    payload_stats = VEPPayloadStats()
+
+    async def run_batch(batch, batch_idx):
+        return await annotate_batch(batch, batch_idx, cache, controller, payload_stats)
+
+    reader = VCFReader(input_vcf_path)
+    batches = iter_vep_batches(iter_vcf_variants(reader), lambda: controller.batch_size)
+    print(f"Streaming adaptive batches, starting at {controller.batch_size} variants and {controller.concurrency} of up to {max_workers} concurrent requests.")
+
+    start_time = time.time()
+    total_variants = 0
+    total_results = 0
+    submitted_batches = 0
+    completed_batches = 0
+    input_exhausted = False
+    pending = {}
+    # File offset at which each pending batch starts; everything before the smallest is done
+    batch_offsets = {}
+    read_offset = 0
+
+    try:
+        while True:
+            # Top up the submission window from the lazy batch generator. Reading and
+            # decompressing the VCF happens in a worker thread, off the shared engine loop.
+            while not input_exhausted and len(pending) < max_pending:
+                batch = await asyncio.to_thread(next, batches, None)
+                if batch is None:
+                    input_exhausted = True
+                    read_offset = reader.size
+                    break
+                pending[asyncio.create_task(run_batch(batch, submitted_batches))] = submitted_batches
+                batch_offsets[submitted_batches] = read_offset
+                read_offset = reader.bytes_read
+                submitted_batches += 1
+                total_variants += len(batch)
+
+            if not pending:
+                break
+
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                batch_idx = pending.pop(task)
+                del batch_offsets[batch_idx]
+                completed_batches += 1
+                try:
+                    batch_result = task.result()
+                except Exception as e:
+                    print(f"Batch {batch_idx} generated an exception: {e}")
+                    continue
+                if not batch_result:
+                    print(f"Batch {batch_idx} failed after all attempts.")
+                    continue
+                total_results += len(batch_result)
+                yield batch_result
+
+            if on_progress:
+                on_progress(min(batch_offsets.values(), default=read_offset), reader.size)
+    finally:
+        for task in pending:
+            task.cancel()
+        reader.close()
+
+    if not submitted_batches:
+        print("No valid variants found in the VCF file. Exiting.")
+        return
+
+    end_time = time.time()
+    print(f"Processed {total_variants} variants in {submitted_batches} batches.")
+    print(f"Total processing time: {end_time - start_time:.2f} seconds")
+    print(f"Total VEP results received: {total_results}")
+    stats_after = cache.stats()
+    print(
+        f"VEP cache: {stats_after['hits'] - stats_before['hits']} hits, "
+        f"{stats_after['misses'] - stats_before['misses']} misses."
+    )
+    print(f"VEP operating point: {controller.operating_point()}")
+    print(f"VEP payloads: {payload_stats.summary()}")
+
 
 if __name__ == "__main__":
     if len(sys.argv) != 2:
@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# Caches and indexes default to CACHE_DIR, read when src modules are imported; keep them out of the tree
+os.environ.setdefault("VARIANTEXPLAIN_CACHE_DIR", tempfile.mkdtemp(prefix="variantexplain-tests-"))
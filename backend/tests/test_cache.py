@@ -0,0 +1,35 @@
+import os
+import time
+import pytest
+from cache import KVCache
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Replace time.time with a clock the test advances by hand."""
+    now = [1_000_000.0]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+    return now
+
+def test_entries_expire_after_ttl(tmp_path, clock):
+    cache = KVCache("ttl_test", path=str(tmp_path / "ttl.sqlite"), ttl=60)
+    cache.put("rs1", {"value": 1})
+    clock[0] += 59
+    assert cache.get("rs1") == {"value": 1}
+    assert [key for key, _ in cache.items()] == ["rs1"]
+    clock[0] += 2
+    assert cache.get("rs1") is None
+    assert list(cache.items()) == []
+    assert cache.stats() == {"hits": 1, "misses": 1}
+
+def test_least_recently_used_entries_are_evicted(tmp_path, clock):
+    # Random hex compresses to about half its length, so each value takes roughly 500 bytes
+    values = {key: os.urandom(500).hex() for key in ("a", "b", "c")}
+    cache = KVCache("lru_test", path=str(tmp_path / "lru.sqlite"), max_bytes=1200)
+    for key in ("a", "b"):
+        clock[0] += 1
+        cache.put(key, values[key])
+    clock[0] += 1
+    assert cache.get("a") == values["a"]
+    clock[0] += 1
+    cache.put("c", values["c"])
+    assert cache.get_many(["a", "b", "c"]) == {"a": values["a"], "c": values["c"]}
@@ -0,0 +1,44 @@
+import asyncio
+import threading
+import chat
+import embeddings
+
+class BlockingIndex:
+    """Vector index stand-in whose indexing waits until the test releases it."""
+    def __init__(self):
+        self.release = threading.Event()
+        self.searched = []
+
+    def index_abstracts(self, abstracts, embedder=None):
+        self.release.wait(5)
+        return len(abstracts)
+
+    def search(self, query, k=5, pmids=None):
+        self.searched.append(list(pmids))
+        return [("2", 0.9)]
+
+def test_questions_use_keywords_until_indexing_finishes(monkeypatch):
+    monkeypatch.setenv("GOOGLE_API_KEY", "test")
+    index = BlockingIndex()
+    monkeypatch.setattr(chat, "get_vector_index", lambda: index)
+    monkeypatch.setattr(chat, "load_abstracts", lambda pmids: {"1": "Asthma in children.", "2": "Height and growth."})
+
+    async def embed(self, texts, task_type=None):
+        return [[1.0, 0.0]]
+
+    monkeypatch.setattr(embeddings.Embedder, "embed_batch_async", embed)
+    associations = [{"pubmedId": "1", "traitName": ["Asthma"]}, {"pubmedId": "2", "traitName": ["Height"]}]
+
+    async def main():
+        session = chat.ChatSession(["Asthma", "Height"], associations)
+        await asyncio.wait_for(session.start(), 1)
+        before = await session.retrieve("Is asthma a risk?")
+        index.release.set()
+        await session._indexing
+        after = await session.retrieve("Is asthma a risk?")
+        return before, after
+
+    before, after = asyncio.run(main())
+    assert before == ["1"]
+    assert index.searched == [["1", "2"]]
+    assert after == ["2"]
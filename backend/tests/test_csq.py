@@ -0,0 +1,42 @@
+from csq import ConsequenceParser
+
+CSQ_FIELDS = ["Allele", "Consequence", "IMPACT", "SYMBOL", "SIFT", "PolyPhen", "Existing_variation"]
+
+def vcf_line(info: str, _id: str = ".") -> str:
+    return f"1\t1000\t{_id}\tA\tG\t50\tPASS\t{info}\n"
+
+def test_parse_line_projects_csq_records():
+    parser = ConsequenceParser("CSQ", CSQ_FIELDS)
+    annotation = parser.parse_line(vcf_line(
+        "DP=10;CSQ=G|missense_variant|MODERATE|GENE1|deleterious(0.01)|benign(0.1)|rs123,"
+        "G|intron_variant|MODIFIER|GENE2|||"
+    ))
+    assert annotation["input"] == "1 1000 . A G"
+    assert annotation["id"] == "rs123"
+    assert annotation["transcript_consequences"] == [
+        {"variant_allele": "G", "impact": "MODERATE", "gene_symbol": "GENE1",
+         "sift_prediction": "deleterious", "polyphen_prediction": "benign"},
+        {"variant_allele": "G", "impact": "MODIFIER", "gene_symbol": "GENE2"},
+    ]
+
+def test_parse_line_ignores_keys_ending_in_csq():
+    parser = ConsequenceParser("CSQ", CSQ_FIELDS)
+    annotation = parser.parse_line(vcf_line("XCSQ=foo;BCSQ=bar;CSQ=G|stop_gained|HIGH|GENE1|||", "rs9"))
+    assert annotation["transcript_consequences"] == [
+        {"variant_allele": "G", "impact": "HIGH", "gene_symbol": "GENE1"}
+    ]
+
+def test_parse_line_ann_with_dbnsfp_predictions():
+    parser = ConsequenceParser("ANN", ["Allele", "Annotation", "Annotation_Impact", "Gene_Name"])
+    annotation = parser.parse_line(vcf_line(
+        "ANN=G|missense_variant|MODERATE|GENE1;dbNSFP_SIFT_pred=D;dbNSFP_Polyphen2_HDIV_pred=B,P", "rs5"
+    ))
+    assert annotation["transcript_consequences"] == [
+        {"variant_allele": "G", "impact": "MODERATE", "gene_symbol": "GENE1",
+         "sift_prediction": "deleterious", "polyphen_prediction": "possibly_damaging"}
+    ]
+
+def test_parse_line_without_key_or_header():
+    parser = ConsequenceParser("CSQ", CSQ_FIELDS)
+    assert parser.parse_line("#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n") is None
+    assert parser.parse_line(vcf_line("DP=10"))["transcript_consequences"] == []
@@ -0,0 +1,73 @@
+import csv
+import os
+import gwas_index
+from gwas_index import GWASIndex, build_index, current_version
+
+COLUMNS = ["SNPS", "STRONGEST SNP-RISK ALLELE", "DISEASE/TRAIT", "PUBMEDID", "P-VALUE", "OR or BETA", "95% CI (TEXT)"]
+
+def write_catalog(path, rows):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, COLUMNS, delimiter="\t")
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(dict(zip(COLUMNS, row)))
+
+def open_live(index_dir):
+    return GWASIndex(os.path.join(index_dir, current_version(index_dir)))
+
+def test_build_and_lookup(tmp_path):
+    tsv = tmp_path / "catalog.tsv"
+    write_catalog(tsv, [
+        ("rs10", "rs10-A", "Height", "111", "5E-8", "0.12", "[0.1-0.14] cm increase"),
+        ("rs10", "rs10-A", "Asthma", "222", "3E-20", "1.3", "[1.2-1.4]"),
+        ("rs7; rs10", "rs7-G; rs10-T", "Gout", "333", "1E-9", "", ""),
+    ])
+    index_dir = str(tmp_path / "index")
+    assert build_index(str(tsv), index_dir) == 2
+    index = open_live(index_dir)
+    assert len(index) == 2
+
+    rs10 = index.lookup("rs10")
+    assert [a["traitName"] for a in rs10] == [["Asthma"], ["Gout"], ["Height"]]
+    assert rs10[0]["orValue"] == 1.3 and rs10[0]["pValue"] == 3 and rs10[0]["pValueExponent"] == -20
+    assert rs10[2]["beta"] == 0.12
+    # A multi-SNP row keeps only each rsID's own risk allele
+    assert rs10[1]["riskAllele"] == [{"key": "rs10-T", "label": "rs10-T"}]
+    assert index.lookup("RS7")[0]["riskAllele"] == [{"key": "rs7-G", "label": "rs7-G"}]
+    assert index.lookup("rs8") == []
+    assert index.lookup("not-an-rsid") == []
+
+def test_rebuild_swaps_in_a_new_build(tmp_path):
+    tsv = tmp_path / "catalog.tsv"
+    index_dir = str(tmp_path / "index")
+    write_catalog(tsv, [("rs1", "rs1-A", "Height", "1", "1E-8", "", "")])
+    build_index(str(tsv), index_dir)
+    first = current_version(index_dir)
+    old_index = open_live(index_dir)
+
+    write_catalog(tsv, [("rs2", "rs2-C", "Asthma", "2", "1E-8", "", "")])
+    build_index(str(tsv), index_dir)
+    assert current_version(index_dir) != first
+    assert sorted(os.listdir(index_dir)) == ["CURRENT", current_version(index_dir)]
+    assert open_live(index_dir).lookup("rs1") == []
+    assert open_live(index_dir).lookup("rs2")[0]["traitName"] == ["Asthma"]
+    # Indexes opened before the rebuild keep serving their mapped build
+    assert old_index.lookup("rs1")[0]["traitName"] == ["Height"]
+
+def test_build_merges_sorted_runs(tmp_path, monkeypatch):
+    tsv = tmp_path / "catalog.tsv"
+    write_catalog(tsv, [
+        (f"rs{n % 7}", f"rs{n % 7}-A", f"Trait {n}", str(n), f"{n + 1}E-8", "", "")
+        for n in range(50)
+    ])
+    whole_dir, runs_dir = str(tmp_path / "whole"), str(tmp_path / "runs")
+    build_index(str(tsv), whole_dir)
+    monkeypatch.setattr(gwas_index, "BUILD_RUN_SIZE", 3)
+    assert build_index(str(tsv), runs_dir) == 7
+    whole, merged = open_live(whole_dir), open_live(runs_dir)
+    for n in range(7):
+        associations = merged.lookup(f"rs{n}")
+        assert associations == whole.lookup(f"rs{n}")
+        assert [a["pubmedId"] for a in associations] == [str(m) for m in range(n, 50, 7)]
+    # Sorted runs are deleted once merged
+    assert sorted(os.listdir(os.path.join(runs_dir, current_version(runs_dir)))) == ["associations.jsonl", "rsid.idx"]
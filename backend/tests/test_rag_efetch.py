@@ -0,0 +1,43 @@
+import threading
+import pytest
+import eutils_stub
+import rag
+from http_engine import get_engine
+
+@pytest.fixture
+def eutils(monkeypatch):
+    """Serve the E-utilities stand-in on a free port and point rag at it."""
+    server = eutils_stub.serve(0, {"123": "Risk & <reward>."})
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(rag, "EUTILS_BASE", f"http://127.0.0.1:{server.server_address[1]}")
+    yield
+    server.shutdown()
+    server.server_close()
+
+def test_efetch_response_is_parsed_per_article(eutils):
+    abstracts = get_engine().run(rag.RAG()._fetch_abstracts_from_pubmed_ids(["123", "456", "450"]))
+    assert abstracts == {
+        "123": "Risk & <reward>.",
+        "456": "Placeholder abstract for PubMed ID 456.",
+        "450": None,
+    }
+
+def test_articles_without_abstract_are_cached_as_misses(eutils, monkeypatch):
+    first = get_engine().run(rag.RAG().resolve_abstracts(["780", "781"]))
+    assert first == {"780": None, "781": "Placeholder abstract for PubMed ID 781."}
+    assert rag.get_abstract_store().get_many(["780", "781"]) == {"781": first["781"]}
+
+    requested = []
+
+    async def fetch(self, pubmed_ids):
+        requested.extend(pubmed_ids)
+        return {}
+
+    monkeypatch.setattr(rag.RAG, "_fetch_abstracts_from_pubmed_ids", fetch)
+    assert get_engine().run(rag.RAG().resolve_abstracts(["780", "781"])) == first
+    assert requested == []
+
+    monkeypatch.setattr(rag.get_abstract_misses(), "ttl", 0)
+    get_engine().run(rag.RAG().resolve_abstracts(["780"]))
+    assert requested == ["780"]
@@ -0,0 +1,52 @@
+import asyncio
+import pytest
+from singleflight import SingleFlight
+
+def test_concurrent_callers_share_one_call():
+    flights = SingleFlight("test")
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "value"
+
+    async def main():
+        return await asyncio.gather(flights.do("k", fetch), flights.do("k", fetch))
+
+    assert asyncio.run(main()) == ["value", "value"]
+    assert len(calls) == 1
+    assert flights.stats() == {"requested": 2, "shared": 1, "in_flight": 0}
+
+def test_failure_reaches_every_caller_and_frees_the_key():
+    flights = SingleFlight("test")
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    async def main():
+        return await asyncio.gather(flights.do("k", fail), flights.do("k", fail), return_exceptions=True)
+
+    assert [type(outcome) for outcome in asyncio.run(main())] == [RuntimeError, RuntimeError]
+    assert flights.stats()["in_flight"] == 0
+
+def test_failed_batch_drops_only_its_own_keys():
+    flights = SingleFlight("test")
+
+    async def fetch(keys):
+        await asyncio.sleep(0.01)
+        if "bad" in keys:
+            raise RuntimeError("upstream down")
+        return {key: key.upper() for key in keys}
+
+    async def main():
+        first = asyncio.ensure_future(flights.do_many(["bad", "shared"], fetch))
+        await asyncio.sleep(0)
+        # "shared" joins the failing call; "good" gets a call of its own
+        second = await flights.do_many(["shared", "good"], fetch)
+        return await first, second
+
+    first, second = asyncio.run(main())
+    assert first == {}
+    assert second == {"good": "GOOD"}
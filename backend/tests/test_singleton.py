@@ -0,0 +1,26 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from singleton import process_wide
+
+def test_concurrent_first_calls_create_one_instance():
+    created = []
+    start = threading.Barrier(8)
+
+    @process_wide
+    def get_store():
+        """Return the shared store."""
+        created.append(object())
+        time.sleep(0.05)
+        return created[-1]
+
+    def call():
+        start.wait()
+        return get_store()
+
+    with ThreadPoolExecutor(8) as pool:
+        instances = list(pool.map(lambda _: call(), range(8)))
+    assert len(created) == 1
+    assert all(instance is created[0] for instance in instances)
+    assert get_store() is created[0]
+    assert get_store.__doc__ == "Return the shared store."
@@ -0,0 +1,23 @@
+import gzip
+import io
+import pytest
+from uploads import store_upload
+
+VCF_TEXT = b"##fileformat=VCFv4.2\n#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n1\t1\trs1\tA\tG\t.\tPASS\t.\n"
+
+@pytest.mark.parametrize("filename, content, suffix", [
+    ("sample.vcf", VCF_TEXT, ".vcf"),
+    ("sample.VCF.GZ", gzip.compress(VCF_TEXT), ".vcf.gz"),
+    ("sample.vcf.bgz", gzip.compress(VCF_TEXT), ".vcf.gz"),
+])
+def test_vcf_uploads_are_stored_by_hash(tmp_path, filename, content, suffix):
+    stored_name, sha256, size = store_upload(io.BytesIO(content), tmp_path, filename)
+    assert stored_name == sha256 + suffix
+    assert size == len(content)
+    assert (tmp_path / stored_name).read_bytes() == content
+
+@pytest.mark.parametrize("filename", ["archive.tar.gz", "notes.txt.gz", "example.rdata", "sample.vcf.zip"])
+def test_other_files_are_rejected(tmp_path, filename):
+    with pytest.raises(ValueError, match="Unsupported file type"):
+        store_upload(io.BytesIO(gzip.compress(VCF_TEXT)), tmp_path, filename)
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,78 @@
+import gzip
+import json
+import httpx
+import pytest
+import vep
+from cache import KVCache
+from http_engine import get_engine
+
+@pytest.fixture
+def vep_server():
+    """Route the shared engine to a mock VEP endpoint for the test; yields the POSTed batch sizes."""
+    engine = get_engine()
+    posts = []
+    rules = {}
+
+    def handler(request):
+        variants = json.loads(request.content)["variants"]
+        posts.append(len(variants))
+        for rule in rules.values():
+            response = rule(variants)
+            if response is not None:
+                return response
+        return httpx.Response(200, json=[{"input": variant} for variant in variants])
+
+    async def swap(client):
+        previous, engine.client = engine.client, client
+        return previous
+
+    previous = engine.run(swap(httpx.AsyncClient(transport=httpx.MockTransport(handler))))
+    yield posts, rules
+    engine.run(swap(previous))
+
+def send(variants, controller):
+    return get_engine().run(vep.send_vep_batch(variants, 0, controller))
+
+def test_malformed_variant_is_dropped_alone(vep_server):
+    posts, rules = vep_server
+    rules["bad"] = lambda variants: (
+        httpx.Response(400, json={"error": "Could not parse variant"}) if any("BAD" in v for v in variants) else None
+    )
+    variants = [f"1 {i} . A G" for i in range(200)]
+    variants[137] = "1 137 BAD A G"
+    controller = vep.VEPRateController(4, batch_size=200)
+    result = send(variants, controller)
+    assert [annotation["input"] for annotation in result] == variants[:137] + variants[138:]
+    assert controller.max_batch_size == vep.MAX_BATCH_SIZE
+    assert len(posts) < 20
+
+def test_oversized_batch_is_split_and_ceiling_lowered(vep_server):
+    posts, rules = vep_server
+    rules["size"] = lambda variants: (
+        httpx.Response(413, text="Request Entity Too Large") if len(variants) > 60 else None
+    )
+    controller = vep.VEPRateController(4, batch_size=200)
+    result = send([f"1 {i} . A G" for i in range(200)], controller)
+    assert len(result) == 200
+    assert controller.max_batch_size < 200
+    assert max(posts[-4:]) <= 60
+
+def test_stream_progress_tracks_bytes_of_gzip_input(vep_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(vep, "get_vep_cache", lambda: KVCache("vep_annotations", path=str(tmp_path / "vep.sqlite")))
+    vcf_path = tmp_path / "input.vcf.gz"
+    with gzip.open(vcf_path, "wt") as f:
+        f.write("##fileformat=VCFv4.2\n#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n")
+        for i in range(5000):
+            f.write(f"1\t{i + 1}\trs{i}\tA\tG\t.\tPASS\t.\n")
+    progress = []
+
+    async def consume():
+        async for _ in vep.stream_vep_annotations(str(vcf_path), 4, on_progress=lambda done, total: progress.append((done, total))):
+            pass
+
+    get_engine().run(consume())
+    size = vcf_path.stat().st_size
+    assert all(total == size for _, total in progress)
+    assert [done for done, _ in progress] == sorted(done for done, _ in progress)
+    assert progress[0][0] < size
+    assert progress[-1][0] == size
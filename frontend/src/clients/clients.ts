@@ -13,6 +13,8 @@ import type {
 
 export interface AnalysisResponse {
   message: string;
+  job_id?: string | null;
+  cached?: boolean;
 }
 
 export interface BodyUploadFileUploadFilePost {
@@ -21,6 +23,9 @@ export interface BodyUploadFileUploadFilePost {
 
 export interface FileUploadResponse {
   filename: string;
+  original_filename?: string | null;
+  sha256?: string | null;
+  size?: number | null;
 }
 
 export interface HTTPValidationError {
@@ -33,6 +38,7 @@ export interface HealthResponse {
 
 export interface ResultsResponse {
   results: TraitSummary[];
+  images_pending?: boolean;
 }
 
 export type StatusPollResponseStatus = typeof StatusPollResponseStatus[keyof typeof StatusPollResponseStatus];
@@ -41,6 +47,7 @@ export type StatusPollResponseStatus = typeof StatusPollResponseStatus[keyof typ
 // eslint-disable-next-line @typescript-eslint/no-redeclare
 export const StatusPollResponseStatus = {
   idle: 'idle',
+  queued: 'queued',
   starting: 'starting',
   vep_annotation: 'vep_annotation',
   find_damaging_variants: 'find_damaging_variants',
@@ -68,6 +75,7 @@ export interface StatusPollResponse {
   current?: StatusPollResponseCurrent;
   total?: StatusPollResponseTotal;
   message?: StatusPollResponseMessage;
+  images_pending?: boolean;
 }
 
 export type TraitSummaryGoodOrBad = typeof TraitSummaryGoodOrBad[keyof typeof TraitSummaryGoodOrBad];